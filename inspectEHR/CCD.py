@@ -2,26 +2,64 @@ import warnings
 import numpy as np
 import pandas as pd
 import os
-
-
+import json
+import hashlib
+import shutil
+from collections import deque, OrderedDict
+from multiprocessing import Pool
+
+from inspectEHR.utils import iter_json_array, sorted_join, timedelta_to_ns, episode_positions
+from inspectEHR.csr import CSRStore
+
+try:
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+# Minimum string widths for columns appended to HDF5 tables in batches (widths
+# are fixed by the first append so must allow for longer values in later
+# batches); a store written at once takes its widths from the data, unless
+# written with a data_hash to be appended to later
+HDF_MIN_ITEMSIZE = {'NHICcode': 24, 'site_id': 16, 'episode_id': 32,
+                    'item1d': 256, 'item2d': 64}
+# Compression of the HDF5 store (padding of fixed width strings compresses well)
+HDF_COMPLIB = 'blosc'
+HDF_COMPLEVEL = 5
+# Item table columns that are indexed and can be used in a where query
+HDF_DATA_COLUMNS = ['NHICcode', 'site_id', 'eid']
 
 class CCD:
     def __init__(self, filepath, spec, random_sites=False, random_sites_list=list('ABCDE'),
-                 id_columns=('site_id', 'episode_id')):
+                 id_columns=('site_id', 'episode_id'), batch_size=None, lazy=False):
         """ Reads and processes CCD object, provides methods to extract NHIC data items.
         With JSON will load and
             - provide methods to extract single items
             - provide methods to extract all to h5
+        With JSON and a batch_size the file is streamed rather than loaded, and
+        episodes are parsed and processed batch_size at a time
         With h5 will load and make available as infotb, item_1d, and item_2d dataframes
+        (sorted by NHICcode with the row range of each code held in item_index, and
+        with NHICcode and site_id as categoricals and episodes keyed by eid)
+        unless lazy, when only infotb is loaded and items are queried from the store
+        With a .parquet directory (written by json2hdf) will load infotb and read
+        items from the partitioned item_1d and item_2d datasets on demand
+        With a .csr directory (written by json2hdf) will memory map 2d items
 
         Args:
-            filepath (str): Path to CCD JSON object or h5 file
+            filepath (str): Path to CCD JSON object, h5 file or parquet directory
             spec: data specification as dictionary
             With JSON:
                 random_sites (bool): If True,  adds fake site IDs for testing purposes.
                 random_sites_list (list): Fake site IDs used if add_random_sites is True
             id_columns (tuple): Columns to concatenate to form unique IDs. Defaults to
                 concatenating site and episode IDs.
+            batch_size (int): If not None, stream episodes from the JSON in batches
+                of this size so peak memory depends on batch_size not file size
+            With h5:
+                lazy (bool): If True, keep the store open and read each item
+                    with a where query (store must be written by json2hdf as tables)
         """
         if not os.path.exists(filepath):
             raise ValueError("Path to data not valid")
@@ -35,23 +73,72 @@ class CCD:
             self.random_sites = random_sites
             self.random_sites_list = random_sites_list
             self.id_columns = id_columns
+            self.batch_size = batch_size
             self.ccd = None
-            self._load_from_json()
-            self._add_random_sites()
-            self.infotb = self._extract_infotb()
-            self._add_unique_ids(self.ccd)
+            # set by the first scan (and so holds the random sites drawn then)
+            self.infotb = None
+            if self.batch_size is None:
+                self._load_from_json()
+                self._add_random_sites(self.ccd)
+                self.infotb = self._extract_infotb(self.ccd)
+                self._add_unique_ids(self.ccd)
+            else:
+                # streaming: only infotb (one small row per episode) is kept
+                self._check_ccd_quality()
+                self.infotb = pd.concat([self._extract_infotb(ccd)
+                                         for ccd in self._iter_ccd()])
             self._add_unique_ids(self.infotb)
         elif self.ext == '.h5':
             self.ext = 'h5'
-            store = pd.HDFStore(self.filepath)
+            self.lazy = lazy
+            self.item_index = {}
+            store = pd.HDFStore(self.filepath, mode='r')
             self.infotb = store.get('infotb')
-            self.item_1d = store.get('item_1d')
-            self.item_2d = store.get('item_2d')
-            store.close()
+            if self.lazy:
+                if not all(store.get_storer(k).is_table for k in ['item_1d', 'item_2d']):
+                    store.close()
+                    raise ValueError('!!! lazy mode needs item tables: re-run json2hdf')
+                self.store = store
+                self.item_1d, self.item_2d = None, None
+                # row ranges saved with a sorted store permit reads by position
+                for k in ['item_1d', 'item_2d']:
+                    if '/{}_index'.format(k) in store.keys():
+                        self.item_index[k] = _offsets_to_dict(store.get(k + '_index'))
+            else:
+                for k in ['item_1d', 'item_2d']:
+                    df = self._sort_by_code(store.get(k))
+                    setattr(self, k, df)
+                    self.item_index[k] = _offsets_to_dict(_code_offsets(df['NHICcode']))
+                store.close()
+        elif self.ext == '.parquet':
+            self.ext = 'parquet'
+            if pa is None:
+                raise ImportError('!!! pyarrow is required to read parquet datasets')
+            self.infotb = pd.read_parquet(os.path.join(self.filepath, 'infotb.parquet'))
+            self.item_1d = self._open_dataset('item_1d')
+            self.item_2d = self._open_dataset('item_2d')
+        elif self.ext == '.csr':
+            self.ext = 'csr'
+            self.csr = CSRStore(self.filepath)
+            self.infotb = self.csr.infotb
+            self.item_1d = self.csr.item_1d
         else:
-            raise ValueError('Expects a JSON or h5 file')
+            raise ValueError('Expects a JSON or h5 file or parquet directory')
+
 
 
+    def close(self):
+        """Close the h5 store held open in lazy mode"""
+        store = getattr(self, 'store', None)
+        if store is not None:
+            store.close()
+            self.store = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
 
     def __str__(self):
         '''Print helpful summary of object'''
@@ -63,18 +150,61 @@ class CCD:
     def _load_from_json(self):
         """ Reads in CCD object into pandas DataFrame, checks that format is as expected."""
         with open(self.filepath, 'r') as f:
-            self.ccd = pd.read_json(f)
+            # precise_float so values (and data_hash) match a streamed parse
+            self.ccd = pd.read_json(f, precise_float=True)
+        # integer episode key (row of the episode in infotb)
+        self.ccd['eid'] = np.arange(len(self.ccd))
         self._check_ccd_quality()
 
     def _check_ccd_quality(self):
         # TODO: Implement quality checking
         warnings.warn('Quality checking of source JSON not yet implemented.')
 
-    def _add_random_sites(self):
-        """ Optionally adds random site IDs for testing purposes."""
+    def _iter_json_batches(self):
+        """ Stream the JSON as DataFrames of at most batch_size episodes."""
+        batch = []
+        start = 0
+        for episode in iter_json_array(self.filepath):
+            batch.append(episode)
+            if len(batch) == self.batch_size:
+                yield self._batch_to_df(batch, start)
+                start += len(batch)
+                batch = []
+        if batch:
+            yield self._batch_to_df(batch, start)
+
+    @staticmethod
+    def _batch_to_df(batch, start):
+        """ DataFrame of a batch of episodes, numbered (eid) from start."""
+        df = pd.DataFrame(batch, index=range(start, start + len(batch)))
+        df['eid'] = df.index
+        return df
+
+    def _iter_ccd(self):
+        """ Iterate over the CCD episodes as one or more DataFrames.
+
+        Yields the whole of self.ccd when loaded, otherwise streams batches from
+        the JSON with random sites added and unique IDs set as for self.ccd.
+        """
+        if self.ccd is not None:
+            yield self.ccd
+        else:
+            for ccd in self._iter_json_batches():
+                self._add_random_sites(ccd)
+                # - [ ] @NOTE: uniqueness of ids only checked within a batch
+                self._add_unique_ids(ccd)
+                yield ccd
+
+    def _add_random_sites(self, dt):
+        """ Optionally adds random site IDs for testing purposes.
+        Sites are drawn once; later scans of a streamed JSON reuse those in
+        infotb (by eid) so that extracted items match infotb."""
         if self.random_sites:
+            if self.infotb is not None:
+                dt['site_id'] = self.infotb['site_id'].values[dt['eid'].values]
+                return
             sites_series = pd.Series(self.random_sites_list)
-            self.ccd['site_id'] = sites_series.sample(len(self.ccd), replace=True).values
+            dt['site_id'] = sites_series.sample(len(dt), replace=True).values
 
     def _add_unique_ids(self, dt):
         """ Define a unique ID for CCD data."""
@@ -87,23 +217,43 @@ class CCD:
         assert not any(dt.duplicated(subset='id'))  # Check unique
         dt.set_index('id', inplace=True)  # Set index
 
-    def _build_df(self, nhic_code, by):
-        """ Build DataFrame for specific item from original JSON."""
-        # TODO: Eliminate loop
-        individual_dfs = []
-        for row in self.ccd.itertuples():
-            try:
+    def _build_dfs(self, nhic_codes, by):
+        """ Build DataFrames for several items from original JSON in one scan.
+
+        Returns:
+            dict: NHICcode to DataFrame with item1d or item2d (and time) and byvar
+        """
+        # flat buffers per code, built into one DataFrame each at the end
+        buffers = OrderedDict((k, {'id': [], 'value': [], 'time': [], 'byvar': [], 'd2d': False})
+                              for k in nhic_codes)
+        lookup = set(buffers)
+        for row in (r for ccd in self._iter_ccd() for r in ccd.itertuples()):
+            bv = getattr(row, by)
+            for nhic_code in lookup.intersection(row.data):
                 d = row.data[nhic_code]
-                bv = getattr(row, by)
+                b = buffers[nhic_code]
                 if type(d) == dict:  # If 2d then data stored as dict of lists
-                    d = pd.DataFrame(d, index=np.repeat(row.Index, len(d['item2d'])))
-                    d['byvar'] = bv
+                    n = len(d['item2d'])
+                    b['d2d'] = True
+                    b['value'].extend(d['item2d'])
+                    b['time'].extend(d['time'])
                 else:  # else data stored as single item
-                    d = pd.DataFrame({'item1d': d, 'byvar': bv}, index=[row.Index])
-                individual_dfs.append(d)
-            except KeyError:
-                individual_dfs.append(None)
-        return pd.concat(individual_dfs)
+                    n = 1
+                    b['value'].append(d)
+                    b['time'].append(np.nan)
+                b['id'].extend([row.Index] * n)
+                b['byvar'].extend([bv] * n)
+
+        dfs = {}
+        for nhic_code, b in buffers.items():
+            index = pd.Index(b['id'], name='id')
+            if b['d2d']:
+                dfs[nhic_code] = pd.DataFrame({'item2d': b['value'], 'time': b['time'], 'byvar': b['byvar']},
+                                              index=index, columns=['item2d', 'time', 'byvar'])
+            else:
+                dfs[nhic_code] = pd.DataFrame({'item1d': b['value'], 'byvar': b['byvar']},
+                                              index=index, columns=['item1d', 'byvar'])
+        return dfs
 
     @staticmethod
     def _rename_data_columns(df):
@@ -134,63 +284,423 @@ class CCD:
         """
         # TODO: Standardise column order
         if self.ext == 'json':
-            df = self._build_df(nhic_code, by)
-            df = self._rename_data_columns(df)
-            df = self._convert_to_timedelta(df)
-            return df
+            return self.extract_many([nhic_code], by=by)[nhic_code]
         elif self.ext == 'h5':
             # method for h5
-            if self.spec[nhic_code]['dateandtime']:
-                df = self.item_2d[self.item_2d['NHICcode'] == nhic_code]
+            key = 'item_2d' if self._is_2d(nhic_code) else 'item_1d'
+            if key in self.item_index:
+                # rows for each code are contiguous so slice rather than mask
+                start, stop = self.item_index[key].get(nhic_code, (0, 0))
+                if self.lazy:
+                    df = self.store.select(key, start=start, stop=stop)
+                else:
+                    df = getattr(self, key).iloc[start:stop].copy()
             else:
-                df = self.item_1d[self.item_1d['NHICcode'] == nhic_code]
+                df = self.store.select(key, where='NHICcode == {!r}'.format(nhic_code))
+            if 'eid' in df.columns:
+                # decode episode_id from infotb (eid is the row in infotb)
+                df['episode_id'] = self.infotb['episode_id'].values[df['eid'].values]
+            return self._format_long(df, by)
+
+        elif self.ext == 'parquet':
+            if self._is_2d(nhic_code):
+                dataset, columns = self.item_2d, ['item2d', 'time']
+            else:
+                dataset, columns = self.item_1d, ['item1d']
+            # only read the NHICcode partition, and only the columns needed
+            columns = list(OrderedDict.fromkeys(columns + ['site_id', 'episode_id', by]))
+            if 'eid' in dataset.schema.names:
+                # index by eid as episode_ids does
+                columns.append('eid')
+            df = dataset.to_table(filter=ds.field('NHICcode') == nhic_code,
+                                  columns=columns).to_pandas()
+            return self._format_long(df, by)
+
+        elif self.ext == 'csr':
+            if self._is_2d(nhic_code):
+                df = self.csr.to_frame(nhic_code)
+            else:
+                df = self.item_1d[self.item_1d['NHICcode'] == nhic_code].copy()
+            df['episode_id'] = self.infotb['episode_id'].values[df['eid'].values]
+            return self._format_long(df, by)
 
-            # Switch off annoying warning message: see https://stackoverflow.com/a/20627316/992999
-            pd.options.mode.chained_assignment = None  # default='warn'
-            df['id'] = df['site_id'].astype(str) + df['episode_id'].astype(str)
-            df.set_index('id', inplace=True)
-            df.drop(['NHICcode'], axis=1, inplace=True)
-            # - [ ] @TODO: (2017-07-16) allow other byvars from 1d or infotb items
-            #   for now leave site_id and episode_id in to permit easy future merge
-            df['byvar'] = df[by]
-            df.rename(columns={'item2d': 'value', 'item1d': 'value'}, inplace=True)
-            pd.options.mode.chained_assignment = 'warn'  # default='warn'
+        else:
+            raise ValueError('!!! ccd object derived from file with unrecognised extension {}'.format(DataRawNew.ccd.ext))
+
+    def _is_2d(self, nhic_code):
+        """Whether an item is time varying (meta items are not in the spec but are)"""
+        if nhic_code in self.spec:
+            return self.spec[nhic_code]['dateandtime']
+        return True
+
+    def extract_with_meta(self, nhic_code, by="site_id", meta_code=None):
+        """ Extract a 2d item joined to its meta item (spec NHICmetaCode)
 
+        The meta value recorded in the same episode at the same time is joined
+        to every value of the item, for all episodes at once by a sorted key
+        join on (episode, time) rather than episode by episode.
+
+        Args:
+            nhic_code (str): Reference for item to extract
+            by (str): Allows reporting / analysis by category. Defaults to site
+            meta_code (str): Meta item (defaults to the NHICmetaCode in the spec)
+
+        Returns:
+            DataFrame: as extract_one with the meta value in a meta column
+                (NaN where there is none)
+        """
+        if meta_code is None:
+            meta_code = self.spec[nhic_code].get('NHICmetaCode')
+        if meta_code is None:
+            raise ValueError('!!! {} has no NHICmetaCode in the spec'.format(nhic_code))
+        dfs = self.extract_many([nhic_code, meta_code], by=by)
+        df, meta = dfs[nhic_code], dfs[meta_code]
+        if not len(df) or not len(meta) or 'time' not in df.columns:
+            df['meta'] = np.nan
             return df
+        ids = pd.Index(self.episode_ids())
+        pos, meta_pos = episode_positions(ids, df.index), episode_positions(ids, meta.index)
+        row = sorted_join([pos, timedelta_to_ns(df['time'].values)],
+                          [meta_pos, timedelta_to_ns(meta['time'].values)])
+        df['meta'] = np.r_[np.asarray(meta['value'], dtype=object), np.nan][row]
+        return df
+
+    def iter_item(self, nhic_code, chunksize, by="site_id"):
+        """ Extract a single NHIC data item from a lazy h5 store in chunks
+
+        Each chunk holds at most chunksize rows, formatted as from extract_one
+        (see iter_many).
+
+        Args:
+            nhic_code (str): Reference for item to extract
+            chunksize (int): Maximum rows read at once
+            by (str): Allows reporting / analysis by category. Defaults to site
+        """
+        for _, df in self.iter_many([nhic_code], chunksize, by=by):
+            yield df
+
+    def iter_many(self, nhic_codes, chunksize, by="site_id"):
+        """ Extract several NHIC data items from a lazy h5 store in chunks
+
+        Each item table is read once, chunksize rows at a time, and the rows of
+        each of nhic_codes in a chunk are yielded in table order. Where the
+        store has an item index only the row ranges of nhic_codes are read;
+        otherwise (a streamed or appended store) the whole table is, as where
+        queries on NHICcode would each scan the table.
 
+        Args:
+            nhic_codes (list): References for items to extract
+            chunksize (int): Maximum rows read at once
+            by (str): Allows reporting / analysis by category. Defaults to site
+
+        Yields:
+            tuple: (NHICcode, DataFrame formatted as from extract_one)
+        """
+        if self.ext != 'h5' or not self.lazy:
+            raise ValueError('!!! chunked extraction needs an h5 store opened with lazy=True')
+        for key in ['item_1d', 'item_2d']:
+            codes = [k for k in nhic_codes if self._is_2d(k) == (key == 'item_2d')]
+            if not codes:
+                continue
+            if key in self.item_index:
+                ranges = sorted(self.item_index[key].get(k, (0, 0)) for k in codes)
+            else:
+                ranges = [(0, self.store.get_storer(key).nrows)]
+            for start, stop in ranges:
+                for i in range(start, stop, chunksize):
+                    df = self.store.select(key, start=i, stop=min(i + chunksize, stop))
+                    df = df[df['NHICcode'].isin(codes)]
+                    if 'eid' in df.columns:
+                        df['episode_id'] = self.infotb['episode_id'].values[df['eid'].values]
+                    for k, part in df.groupby('NHICcode', observed=True, sort=False):
+                        yield str(k), self._format_long(part.copy(), by)
+
+    def extract_many(self, nhic_codes, by="site_id"):
+        """ Extract several NHIC data items
+
+        With JSON all items are collected in a single scan of the episodes,
+        otherwise each is read as with extract_one.
+
+        Args:
+            nhic_codes (list): References for items to extract
+            by (str): Allows reporting / analysis by category. Defaults to site
+
+        Returns:
+            dict: NHICcode to DataFrame as returned by extract_one
+        """
+        if self.ext == 'json':
+            dfs = self._build_dfs(nhic_codes, by)
+            return OrderedDict((k, self._convert_to_timedelta(self._rename_data_columns(df)))
+                               for k, df in dfs.items())
         else:
-            raise ValueError('!!! ccd object derived from file with unrecognised extension {}'.format(DataRawNew.ccd.ext))
+            return OrderedDict((k, self.extract_one(k, by=by)) for k in nhic_codes)
+
+    def episode_ids(self):
+        """Key of each episode (row) of infotb as used for the id index of
+        extract_one, so item data can be aligned to infotb by position"""
+        if self.ext == 'json':
+            return self.infotb.index.values
+        elif self.ext == 'parquet' and 'eid' not in self.item_1d.schema.names:
+            # datasets written without eid are indexed by site and episode
+            return (self.infotb['site_id'].astype(str) + self.infotb['episode_id'].astype(str)).values
+        elif 'eid' in self.infotb.columns:
+            return self.infotb['eid'].values
+        else:
+            return (self.infotb['site_id'].astype(str) + self.infotb['episode_id'].astype(str)).values
+
+    @staticmethod
+    def _sort_by_code(df):
+        """Sort long item data by NHICcode (stable so episode order is kept)"""
+        if df['NHICcode'].is_monotonic_increasing:
+            return df
+        return df.sort_values('NHICcode', kind='mergesort').reset_index(drop=True)
+
+    @staticmethod
+    def _format_long(df, by):
+        """Index long (item_1d or item_2d) rows for one item by id with byvar"""
+        # Switch off annoying warning message: see https://stackoverflow.com/a/20627316/992999
+        pd.options.mode.chained_assignment = None  # default='warn'
+        if 'eid' in df.columns:
+            # integer episode key from the store rather than a concatenated string
+            df.rename(columns={'eid': 'id'}, inplace=True)
+        else:
+            df['id'] = df['site_id'].astype(str) + df['episode_id'].astype(str)
+        df.set_index('id', inplace=True)
+        df.drop(['NHICcode'], axis=1, inplace=True, errors='ignore')
+        # - [ ] @TODO: (2017-07-16) allow other byvars from 1d or infotb items
+        #   for now leave site_id and episode_id in to permit easy future merge
+        df['byvar'] = df[by]
+        df.rename(columns={'item2d': 'value', 'item1d': 'value'}, inplace=True)
+        pd.options.mode.chained_assignment = 'warn'  # default='warn'
+
+        return df
 
     def json2hdf(self,
             ccd_key = ['site_id', 'episode_id'],
             path=None,
-            progress_marker=True):
+            progress_marker=True,
+            n_jobs=None,
+            partition_by_site=False,
+            append=False,
+            data_hash=None):
         '''Extracts all data in ccd object to infotb, 1d, and 2d data frames in HDF5
+        If path ends with .parquet then instead writes a directory holding infotb
+        and item_1d and item_2d datasets partitioned by NHICcode (and site_id)
+        If path ends with .csr then writes a memory mappable CSRStore (this holds
+        all items in memory while writing)
         Args:
             ccd: ccd object (data frame with data column containing dictionary of dictionaries)
             ccd_key: unique key to be stored from ccd object; defaults to site/episode
             path: path to save file
             progress_marker: displays a dot every 10 records
+            n_jobs: if > 1, extract chunks of episodes in this many worker processes
+                (results are written in the original episode order)
+            partition_by_site: if writing parquet, also partition items by site_id
+            append: if True add new episodes, and replace changed ones, in an
+                existing h5 store rather than rebuilding it
+            data_hash: if True store a fingerprint of each episode's data in
+                infotb, so that a later append can detect changed episodes
+                (defaults to append; set it when building a store to append to)
         '''
         if path is None:
             raise NameError('No path provided to which to save the HDF5 file')
-        if not all([k in self.ccd.columns for k in ccd_key]):
+        if not all([k in self.infotb.columns for k in ccd_key]):
             raise KeyError('!!! ccd_key should be a list of column names')
 
-        # Extract and save infotb
-        print('\n*** Extracting all infotb data from {} rows'.format(self.ccd.shape[0]))
-        infotb = self._extract_infotb()
-
-        # Extract and save 1d
-        print('\n*** Extracting all {}d data from {} rows'.format(1, self.ccd.shape[0]))
-        item_1d = self._extract_1d(ccd_key, progress_marker)
-
-        # Extract and save 2d
-        print('\n*** Extracting all {}d data from {} rows'.format(2, self.ccd.shape[0]))
-        item_2d = self._extract_2d(ccd_key, progress_marker)
+        print('\n*** Extracting all infotb, 1d and 2d data from {} rows'.format(len(self.infotb)))
+        if data_hash is None:
+            data_hash = append
+        chunks = self._iter_extracted(list(ccd_key) + ['eid'], progress_marker, n_jobs, data_hash)
+
+        if append:
+            if os.path.splitext(path)[1] != '.h5' or not os.path.exists(path):
+                raise ValueError('!!! append expects an existing h5 store')
+            self._append_hdf(chunks, ccd_key, path)
+        elif os.path.splitext(path)[1] == '.parquet':
+            partition_cols = ['NHICcode', 'site_id'] if partition_by_site else ['NHICcode']
+            infotbs = []
+            # one writer (so one file) per partition for the whole stream
+            writers = {}
+            try:
+                for i, (infotb, item_1d, item_2d) in enumerate(chunks):
+                    infotbs.append(infotb)
+                    dd = {'item_1d': item_1d, 'item_2d': item_2d}
+                    self._ccd2parquet(dd, path, partition_cols, mode='w' if i == 0 else 'a', writers=writers)
+            finally:
+                for writer in writers.values():
+                    writer.close()
+            self._ccd2parquet({'infotb': pd.concat(infotbs, ignore_index=True)}, path, partition_cols, mode='a')
+        elif self.batch_size is None or os.path.splitext(path)[1] == '.csr':
+            infotb, item_1d, item_2d = [pd.concat(dfs, ignore_index=True) for dfs in zip(*chunks)]
+            item_1d, item_2d = [self._sort_by_code(self._encode_items(df, ccd_key))
+                                for df in (item_1d, item_2d)]
+            if os.path.splitext(path)[1] == '.csr':
+                numeric = [k for k, v in self.spec.items() if v['Datatype'] == 'numeric']
+                return CSRStore.write(path, infotb, item_1d, item_2d, numeric=numeric)
+            dd = {'item_1d': item_1d, 'item_2d': item_2d, 'infotb':infotb,
+                  'item_1d_index': _code_offsets(item_1d['NHICcode']),
+                  'item_2d_index': _code_offsets(item_2d['NHICcode'])}
+            # a store that may be appended to gets the widths of a streamed one
+            self._ccd2hdf(dd, path, min_itemsize=HDF_MIN_ITEMSIZE if data_hash else None)
+            self._index_hdf(path)
+        else:
+            # Items are appended to tables in the HDF5 file as each batch is
+            # processed; infotb (one row per episode) is written at the end
+            infotbs = []
+            for i, (infotb, item_1d, item_2d) in enumerate(chunks):
+                infotbs.append(infotb)
+                dd = {'item_1d': self._encode_items(item_1d, ccd_key),
+                      'item_2d': self._encode_items(item_2d, ccd_key)}
+                self._ccd2hdf(dd, path, mode='w' if i == 0 else 'a', append=True,
+                              min_itemsize=HDF_MIN_ITEMSIZE)
+            self._ccd2hdf({'infotb': pd.concat(infotbs, ignore_index=True)}, path, mode='a')
+            self._index_hdf(path)
+
+    def _append_hdf(self, chunks, ccd_key, path):
+        """Add extracted chunks of episodes to an existing h5 store
+        Episodes are matched to those in the store on id_columns. New episodes
+        get the next eid; episodes whose data_hash differs from the stored one
+        keep their eid and have their items replaced; the rest are skipped.
+        The store is no longer sorted by NHICcode so saved row ranges are dropped.
+        All new and changed episodes are extracted, and checked against the
+        widths of the store's columns, before the store is changed, so a
+        delivery that does not fit leaves the store as it was.
+        """
+        with pd.HDFStore(path, mode='r') as store:
+            infotb = store.get('infotb')
+            sites = list(store.select('item_1d', start=0, stop=0)['site_id'].cat.categories)
+        if 'data_hash' not in infotb.columns:
+            warnings.warn('\n!!! Store has no data_hash so changed episodes cannot be detected '
+                          '(build it with json2hdf(data_hash=True))')
+            infotb['data_hash'] = None
+
+        new_sites = set(self.infotb['site_id'].astype(str)) - set(sites)
+        if new_sites:
+            raise ValueError('!!! New site(s) {} not in store: rebuild with json2hdf'.format(
+                ', '.join(sorted(new_sites))))
+
+        def _keys(df):
+            return [tuple(str(v) for v in k) for k in df[list(self.id_columns)].itertuples(index=False)]
+
+        stored = dict(zip(_keys(infotb), zip(infotb['eid'], infotb['data_hash'])))
+        n_stored = next_eid = len(infotb)
+        updates, dds, changed = [], [], []
+        for chunk_infotb, item_1d, item_2d in chunks:
+            # map eid within this delivery to eid in the store
+            eid_map = {}
+            for key, eid, h in zip(_keys(chunk_infotb), chunk_infotb['eid'], chunk_infotb['data_hash']):
+                if key not in stored:
+                    eid_map[eid] = next_eid
+                    stored[key] = (next_eid, h)
+                    next_eid += 1
+                elif stored[key][1] is not None and stored[key][1] != h:
+                    eid_map[eid] = stored[key][0]
+                    changed.append(int(stored[key][0]))
+            if not eid_map:
+                continue
 
-        dd = {'item_1d': item_1d, 'item_2d': item_2d, 'infotb':infotb}
-        self._ccd2hdf(dd, path)
+            chunk_infotb = chunk_infotb[chunk_infotb['eid'].isin(eid_map)].copy()
+            chunk_infotb['eid'] = chunk_infotb['eid'].map(eid_map)
+            updates.append(chunk_infotb)
+            dd = {}
+            for k, df in [('item_1d', item_1d), ('item_2d', item_2d)]:
+                df = df[df['eid'].isin(eid_map)].copy()
+                df['eid'] = df['eid'].map(eid_map)
+                dd[k] = _values_as_str(self._encode_items(df, ccd_key, sites=sites))
+            dds.append(dd)
+
+        if not updates:
+            print('\n*** No new or changed episodes to add to {}'.format(path))
+            return
+        with pd.HDFStore(path, mode='r') as store:
+            for dd in dds:
+                for k, df in dd.items():
+                    _check_itemsize(store.get_storer(k), df, k)
+
+        updates = pd.concat(updates, ignore_index=True)
+        n_new = (updates['eid'] >= n_stored).sum()
+        # infotb kept in eid order so that eid is the row number
+        infotb = pd.concat([infotb[~infotb['eid'].isin(updates['eid'])], updates])
+        infotb = infotb.sort_values('eid').reset_index(drop=True)
+
+        # removing or appending rows of indexed tables reindexes them every
+        # time, so the indexes are dropped and rebuilt (even on error) at the end
+        self._unindex_hdf(path)
+        try:
+            with pd.HDFStore(path, mode='a') as store:
+                for k in ['item_1d', 'item_2d']:
+                    # rows of changed episodes, and of any episode beyond the
+                    # stored infotb (left by an append that failed part way),
+                    # are removed by coordinates: a where query on more than
+                    # 31 eids is a filter that remove ignores (so every row
+                    # would go), as would an empty selection
+                    eid = store.select_column(k, 'eid').values
+                    coords = np.flatnonzero(np.isin(eid, changed) | (eid >= n_stored))
+                    if len(coords):
+                        store.remove(k, where=coords)
+            for dd in dds:
+                self._ccd2hdf(dd, path, mode='a', append=True)
+            with pd.HDFStore(path, mode='a', complevel=HDF_COMPLEVEL, complib=HDF_COMPLIB) as store:
+                store.put('infotb', infotb)
+                for k in ['item_1d_index', 'item_2d_index']:
+                    if k in store:
+                        store.remove(k)
+        finally:
+            self._index_hdf(path)
+        print('\n*** Added {} new and {} changed episodes to {}'.format(
+            n_new, len(updates) - n_new, path))
+
+    def _encode_items(self, df, ccd_key, sites=None):
+        """Dictionary encode long item data for the h5 store
+        NHICcode and site_id become categoricals, stored as small integer codes
+        with the categories (lookups) held in the store. The episode is kept as
+        the integer eid (its row in infotb) and the other ccd_key columns dropped.
+        Categories are fixed (from spec and infotb, or sites given) so that
+        batches can be appended. Meta items named in the spec are kept too.
+        """
+        meta_codes = {v.get('NHICmetaCode') for v in self.spec.values()} - {None}
+        codes = sorted(set(self.spec) | meta_codes | {'pid', 'spell'})
+        unknown = ~df['NHICcode'].isin(codes)
+        if unknown.any():
+            warnings.warn('\n!!! Dropping {} values of items not in spec: {}'.format(
+                unknown.sum(), ', '.join(sorted(df.loc[unknown, 'NHICcode'].unique()))))
+            df = df.loc[~unknown].copy()
+        df['NHICcode'] = pd.Categorical(df['NHICcode'], categories=codes, ordered=True)
+        if sites is None:
+            sites = sorted(self.infotb['site_id'].astype(str).unique())
+        df['site_id'] = pd.Categorical(df['site_id'].astype(str), categories=sites)
+        df['eid'] = df['eid'].astype('int32')
+        return df.drop([k for k in ccd_key if k != 'site_id'], axis=1)
+
+    def _iter_chunks(self, n_jobs):
+        """Split episodes into chunks for extraction
+        Uses the streamed batches if set, else splits self.ccd so that each of
+        n_jobs workers gets several chunks."""
+        if self.ccd is None or n_jobs is None or n_jobs <= 1:
+            for ccd in self._iter_ccd():
+                yield ccd
+        else:
+            chunksize = max(1, -(-len(self.ccd) // (n_jobs * 4)))
+            for start in range(0, len(self.ccd), chunksize):
+                yield self.ccd.iloc[start:start + chunksize]
+
+    def _iter_extracted(self, ccd_key, progress_marker, n_jobs=None, data_hash=False):
+        """Yield (infotb, item_1d, item_2d) for each chunk of episodes in order
+        With n_jobs > 1 chunks are extracted in a process pool. At most 2 * n_jobs
+        chunks are in flight so memory stays bounded when streaming."""
+        if n_jobs is None or n_jobs <= 1:
+            for ccd in self._iter_chunks(n_jobs):
+                yield _extract_chunk(ccd, ccd_key, progress_marker, data_hash)
+            return
+
+        with Pool(n_jobs) as pool:
+            pending = deque()
+            for ccd in self._iter_chunks(n_jobs):
+                pending.append(pool.apply_async(_extract_chunk, (ccd, ccd_key, progress_marker, data_hash)))
+                if len(pending) >= 2 * n_jobs:
+                    yield pending.popleft().get()
+            while pending:
+                yield pending.popleft().get()
 
     @staticmethod
     def df2feather(df, path):
@@ -208,26 +718,135 @@ class CCD:
             print(e)
 
     @staticmethod
-    def _ccd2hdf(dd, path):
-        """Save list of data frames to HDF5 store"""
+    def _ccd2hdf(dd, path, mode='w', append=False, min_itemsize=None):
+        """Save list of data frames to (compressed) HDF5 store
+        Args:
+            mode: mode to open the store ('w' to overwrite, 'a' to add)
+            append: if True append to (or create) tables rather than replace
+            min_itemsize: minimum string widths for tables created (widths
+                are otherwise those of the longest values)
+        """
+        if type(dd) is not dict:
+            raise ValueError('Expects dictionary of dataframes')
+        with pd.HDFStore(path, mode=mode, complevel=HDF_COMPLEVEL, complib=HDF_COMPLIB) as store:
+            for k, v in dd.items():
+                if k not in ['item_1d', 'item_2d']:
+                    # infotb (one row per episode) and indexes stored as fixed frames
+                    store.put(k, v)
+                    continue
+                # items stored as tables that can be queried on HDF_DATA_COLUMNS
+                # tables require string (not mixed) columns with a fixed width
+                v = _values_as_str(v)
+                data_columns = [c for c in HDF_DATA_COLUMNS if c in v.columns]
+                itemsize = _min_itemsize(v, min_itemsize)
+                if append:
+                    if k in store:
+                        _check_itemsize(store.get_storer(k), v, k)
+                    store.append(k, v, data_columns=data_columns, min_itemsize=itemsize, index=False)
+                else:
+                    store.put(k, v, format='table', data_columns=data_columns,
+                              min_itemsize=itemsize, index=False)
+            if not append:
+                print(store)
+
+    @staticmethod
+    def _unindex_hdf(path):
+        """Drop the indexes of the item tables (and stop PyTables indexing rows
+        as they are added) until _index_hdf is called"""
+        with pd.HDFStore(path, mode='a') as store:
+            for k in ['item_1d', 'item_2d']:
+                table = store.get_storer(k).table
+                table.autoindex = False
+                for c in list(table.colindexes):
+                    table.colinstances[c].remove_index()
+
+    @staticmethod
+    def _index_hdf(path):
+        """Index the data columns of the item tables (once all rows are written)"""
+        with pd.HDFStore(path, mode='a') as store:
+            for k in ['item_1d', 'item_2d']:
+                store.create_table_index(k, columns=HDF_DATA_COLUMNS, optlevel=9, kind='full')
+                # (turned off by _unindex_hdf)
+                store.get_storer(k).table.autoindex = True
+
+    @staticmethod
+    def _ccd2parquet(dd, path, partition_cols, mode='w', writers=None):
+        """Save dictionary of data frames to a directory of parquet datasets
+        infotb is saved as a single file, items as datasets partitioned (hive
+        style e.g. item_2d/NHICcode=NIHR_HIC_ICU_0108/) by partition_cols
+        Args:
+            mode: 'w' to replace an existing directory, 'a' to add to it
+            writers: dictionary of open pq.ParquetWriter for each partition,
+                added to as partitions are met, so that batches written in turn
+                go to one file per partition (the caller closes them)
+        """
         if type(dd) is not dict:
             raise ValueError('Expects dictionary of dataframes')
-        store = pd.HDFStore(path, mode='w')
-        {store.put(k,v) for k,v in dd.items()}
-        print(store)
-        store.close()
+        if pa is None:
+            raise ImportError('!!! pyarrow is required to write parquet datasets')
+        if mode == 'w' and os.path.isdir(path):
+            shutil.rmtree(path)
+        os.makedirs(path, exist_ok=True)
+        # writers opened here (without a stream's) are closed here
+        own = writers is None
+        writers = {} if own else writers
 
-    def _extract_infotb(self):
-        """Extract infotb from after JSON import"""
+        try:
+            for k, v in dd.items():
+                if k == 'infotb':
+                    v.to_parquet(os.path.join(path, 'infotb.parquet'))
+                    continue
+                os.makedirs(os.path.join(path, k), exist_ok=True)
+                v = _values_as_str(v).astype({c: str for c in partition_cols})
+                # converted once with the rows of each partition together,
+                # then sliced (without copying) for each partition's writer
+                gid = v.groupby(partition_cols, sort=False).ngroup().values
+                order = np.argsort(gid, kind='mergesort')
+                table = pa.Table.from_pandas(v.drop(partition_cols, axis=1).iloc[order], preserve_index=False)
+                bounds = np.r_[0, np.cumsum(np.bincount(gid))] if len(gid) else [0]
+                parts = v[partition_cols].values[order[bounds[:-1]]]
+                for part, start, stop in zip(map(tuple, parts), bounds[:-1], bounds[1:]):
+                    if (k,) + part not in writers:
+                        d = os.path.join(path, k, *['{}={}'.format(c, p) for c, p in zip(partition_cols, part)])
+                        os.makedirs(d, exist_ok=True)
+                        writers[(k,) + part] = pq.ParquetWriter(
+                            os.path.join(d, 'part-0.parquet'), _parquet_schema(table.schema))
+                    writer = writers[(k,) + part]
+                    writer.write_table(_conform_table(table.slice(start, stop - start), writer.schema))
+        finally:
+            if own:
+                for writer in writers.values():
+                    writer.close()
+
+    def _open_dataset(self, name):
+        """Open partitioned item dataset (reads the file listing, not the data)"""
+        path = os.path.join(self.filepath, name)
+        partition_cols = ['NHICcode']
+        # partitioned by site if the NHICcode directories contain site_id ones
+        code_dirs = [e.path for e in os.scandir(path) if e.is_dir()]
+        if code_dirs and any(e.name.startswith('site_id=') for e in os.scandir(code_dirs[0])):
+            partition_cols.append('site_id')
+        partitioning = ds.partitioning(
+            pa.schema([(c, pa.string()) for c in partition_cols]), flavor='hive')
+        return ds.dataset(path, format='parquet', partitioning=partitioning)
+
+    @staticmethod
+    def _extract_infotb(ccd, data_hash=False):
+        """Extract infotb from after JSON import
+        With data_hash, adds an md5 fingerprint of each episode's data"""
         cols_2drop = ['data']
         cols_timedelta = ['t_admission', 't_discharge', 'parse_time']
 
-        cols_2keep = [i for i  in self.ccd.columns if i not in cols_2drop]; cols_2keep
+        cols_2keep = [i for i  in ccd.columns if i not in cols_2drop]; cols_2keep
         rows_out = []
 
-        for row in self.ccd.itertuples():
+        for row in ccd.itertuples():
             row_in = row._asdict()
             row_out = {k:v for k,v in row_in.items() if k != 'data'}
+            if data_hash:
+                # fingerprint of the episode's data to detect changes on re-delivery
+                row_out['data_hash'] = hashlib.md5(
+                    json.dumps(row_in['data'], sort_keys=True, default=str).encode()).hexdigest()
             try:
                 row_out['spell'] = row_in['data']['spell']
                 row_out['pid'] = row_in['data']['pid']
@@ -242,68 +861,162 @@ class CCD:
 
         return infotb
 
-    def _extract_1d(self, ccd_key, progress_marker):
-        """Extract 1d data from nested dictionary in dataframe after JSON import"""
-        df_from_rows = []
-        i = 0
-
-        for row in self.ccd.itertuples():
-            if progress_marker:
-                if i%10 == 0:
-                    print(".", end='')
-                i += 1
-            df_from_data = []
-            row_key = {k:getattr(row, k) for k in ccd_key}
+    @staticmethod
+    def _extract_items(ccd, ccd_key, progress_marker):
+        """Extract 1d and 2d data from nested dictionary in dataframe after JSON import
+        Single pass over the episodes appending to flat column buffers, from which
+        each of the item_1d and item_2d tables is built once. Keys of a 2d item
+        other than item2d and time become extra columns of item_2d. A 2d item
+        that is malformed is reported and skipped (the episode's other items kept).
 
-            for i, (nhic, d) in enumerate(row.data.items()):
+        Returns:
+            tuple: (item_1d, item_2d) DataFrames
+        """
+        # 1d buffers: one entry per item
+        codes_1d, vals_1d, n_1d = [], [], []
+        # 2d buffers: code and count per item, values and times per observation
+        codes_2d, lens_2d, vals_2d, times_2d, n_2d = [], [], [], [], []
+        # other keys of 2d items: name to (first row, values) of each item
+        extra_2d = OrderedDict()
+        # key values per episode, repeated out to rows at the end
+        keys = {k: [] for k in ccd_key}
+
+        for i, row in enumerate(ccd.itertuples()):
+            if progress_marker and i%10 == 0:
+                print(".", end='')
+
+            row_n_1d, row_n_2d = 0, 0
+            for nhic, d in row.data.items():
                 # Assumes 2d data stored as dictionary
-                if type(d) == dict:
+                if type(d) != dict:
+                    codes_1d.append(nhic)
+                    vals_1d.append(d)
+                    row_n_1d += 1
                     continue
-                else:
-                    df_from_data.append({'NHICcode': nhic, 'item1d': d})
-
-            df = pd.DataFrame(df_from_data)
-            for k,v in row_key.items():
-                df[k] = v
-            df_from_rows.append(df)
-
-        df = pd.concat(df_from_rows)
-        return df
-
-    def _extract_2d(self, ccd_key, progress_marker):
-        """Extract 2d data from nested dictionary in dataframe after JSON import"""
-        df_from_rows = []
-        i = 0
-
-        for row in self.ccd.itertuples():
-
-            if progress_marker:
-                if i%10 == 0:
-                    print(".", end='')
-                i += 1
-
-            row_key = {k:getattr(row, k) for k in ccd_key}
-
-            try:
-                df = row.data
-                df = {k:pd.DataFrame.from_dict(v) for k,v in df.items() if type(v) is dict}
-                df = pd.concat(df)
-                df.reset_index(level=0, inplace=True)
-                df.rename(columns={'level_0':'NHICcode'}, inplace=True)
-
-                for k,v in row_key.items():
-                    df[k] = v
-                df_from_rows.append(df)
-            except ValueError as e:
-                # unable to concatenate, no data?
-                print('!!! Value error for {}'.format(row_key))
-                print(e)
-                continue
-            except Exception as e:
-                print('!!! Error for {}'.format(row_key))
-                print(e)
+                try:
+                    n = len(d['item2d'])
+                    if len(d['time']) != n or any(len(v) != n for v in d.values()):
+                        raise ValueError('{} arrays must all be the same length'.format(nhic))
+                except Exception as e:
+                    print('!!! Error for {} {}'.format({k: getattr(row, k) for k in ccd_key}, nhic))
+                    print(repr(e))
+                    continue
+                for k, v in d.items():
+                    if k not in ('item2d', 'time'):
+                        extra_2d.setdefault(k, []).append((len(vals_2d), v))
+                codes_2d.append(nhic)
+                lens_2d.append(n)
+                vals_2d.extend(d['item2d'])
+                times_2d.extend(d['time'])
+                row_n_2d += n
+
+            for k in ccd_key:
+                keys[k].append(getattr(row, k))
+            n_1d.append(row_n_1d)
+            n_2d.append(row_n_2d)
+
+        item_1d = pd.DataFrame({'NHICcode': codes_1d, 'item1d': vals_1d},
+                               columns=['NHICcode', 'item1d'])
+        item_2d = pd.DataFrame({
+            'NHICcode': np.repeat(np.array(codes_2d, dtype=object), lens_2d),
+            'item2d': vals_2d,
+            # ndarray (not TimedeltaIndex) so the column is not built from Timedelta objects
+            'time': pd.to_timedelta(np.asarray(times_2d, dtype=float), unit='h').values},
+            columns=['NHICcode', 'item2d', 'time'])
+        for k, chunks in extra_2d.items():
+            col = np.full(len(vals_2d), None, dtype=object)
+            for start, v in chunks:
+                col[start:start + len(v)] = v
+            item_2d[k] = col
+        for k, v in keys.items():
+            # Series (not np.array) so that the original dtype is kept
+            v = pd.Series(v)
+            item_1d[k] = v.repeat(n_1d).values
+            item_2d[k] = v.repeat(n_2d).values
+
+        return item_1d, item_2d
+
+
+def _values_as_str(df):
+    """Item values (and any other object columns e.g. from extra keys of 2d
+    items) as strings (JSON values may be a mix of numbers and text)"""
+    df = df.copy()
+    for c in [c for c in df.columns if df[c].dtype == object]:
+        # leave missing values as missing rather than 'None' or 'nan'
+        df[c] = df[c].where(df[c].isnull(), df[c].astype(str))
+    return df
+
+
+def _min_itemsize(df, floors=None):
+    """String widths (min_itemsize) for a table of df: the longest value
+    rounded up to a power of two (leaving room for episodes appended later),
+    or the width in floors if that is larger. Values that are not data
+    columns share the 'values' width, as naming them would make them data
+    columns (which compress poorly)."""
+    floors = floors or {}
+    res = {}
+    for c in df.columns:
+        if df[c].dtype != object:
+            continue
+        n = df[c].dropna().str.len().max() if len(df) else 0
+        n = max(2 ** int(np.ceil(np.log2(max(n if n == n else 0, 1)))), floors.get(c, 1))
+        k = c if c in HDF_DATA_COLUMNS else 'values'
+        res[k] = int(max(n, res.get(k, 1)))
+    return res
+
+
+def _check_itemsize(storer, df, key):
+    """Raise if a string in df is wider than its (fixed width) column in the
+    table of storer, as widths are set when the table is created"""
+    for axis in storer.values_axes:
+        if axis.kind != 'string':
+            continue
+        for c in axis.values:
+            if c not in df.columns or not len(df):
                 continue
-
-        df = pd.concat(df_from_rows)
-        df['time'] = pd.to_timedelta(df['time'], unit='h')
-        return df
+            n = df[c].str.len().max()
+            if n > axis.itemsize:
+                raise ValueError(
+                    '!!! A {} value of {} characters does not fit the {} characters of '
+                    'the {} table: rebuild the store (or raise HDF_MIN_ITEMSIZE[{!r}])'.format(
+                        c, int(n), axis.itemsize, key, c))
+
+
+def _parquet_schema(schema):
+    """Schema for a partition's file from its first table (columns that were
+    all missing, so of null type, take strings as the values would)"""
+    return pa.schema([pa.field(f.name, pa.string()) if pa.types.is_null(f.type) else f for f in schema],
+                     metadata=schema.metadata)
+
+
+def _conform_table(table, schema):
+    """Table with the columns and types of schema (missing columns null), as
+    every batch written to a file must match the schema it was opened with"""
+    extra = set(table.column_names) - set(schema.names)
+    if extra:
+        warnings.warn('\n!!! Dropping columns {} not in the first batch of a partition'.format(
+            ', '.join(sorted(extra))))
+    columns = [table.column(f.name).cast(f.type) if f.name in table.column_names
+               else pa.nulls(len(table), f.type) for f in schema]
+    return pa.Table.from_arrays(columns, schema=schema)
+
+
+def _code_offsets(codes):
+    """Start and stop row of each NHICcode in a sorted column of codes"""
+    codes = np.asarray(codes)
+    starts = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1]]) if len(codes) else []
+    stops = np.r_[starts[1:], len(codes)] if len(codes) else []
+    return pd.DataFrame({'NHICcode': codes[starts], 'start': starts, 'stop': stops},
+                        columns=['NHICcode', 'start', 'stop'])
+
+
+def _offsets_to_dict(offsets):
+    """Lookup of NHICcode to (start, stop) from _code_offsets"""
+    return {code: (start, stop) for code, start, stop in offsets.itertuples(index=False)}
+
+
+def _extract_chunk(ccd, ccd_key, progress_marker=False, data_hash=False):
+    """Extract infotb, 1d and 2d data from a chunk of episodes
+    Module level so that it can be sent to worker processes."""
+    item_1d, item_2d = CCD._extract_items(ccd, ccd_key, progress_marker)
+    return CCD._extract_infotb(ccd, data_hash), item_1d, item_2d
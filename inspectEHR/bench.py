@@ -0,0 +1,257 @@
+import os
+import sys
+import gc
+import time
+import argparse
+import warnings
+import tempfile
+import tracemalloc
+import importlib.util
+from collections import OrderedDict
+import pandas as pd
+
+from inspectEHR.utils import load_spec
+from inspectEHR.CCD import CCD
+from inspectEHR.data_classes import DataRaw
+from inspectEHR.synthetic import SyntheticCCD
+
+
+# fields built by DataRaw (as inspected by inspector.py)
+DATARAW_TYPES = ['numeric', 'list', 'list / logical', 'Logical']
+
+
+def dataraw_memory(NHICcodes, ccd, spec, repeat=1):
+    """Memory, time and garbage collection for building a DataRaw per field
+
+    Args:
+        NHICcodes (list): fields to build (not Date/Time fields)
+        ccd: CCD object
+        spec: data dictionary
+        repeat (int): build all the fields this many times
+
+    Returns:
+        OrderedDict: items built, seconds, peak and retained traced memory
+            (bytes), gc collections, size of an instance and mixin classes
+    """
+    gc.collect()
+    collections = sum(s['collections'] for s in gc.get_stats())
+    classes = len(DataRaw.__subclasses__())
+    tracemalloc.start()
+    t = time.time()
+    items = []
+    for _ in range(repeat):
+        items = [DataRaw(k, ccd=ccd, spec=spec) for k in NHICcodes]
+    seconds = time.time() - t
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    res = OrderedDict()
+    res['items'] = len(NHICcodes) * repeat
+    res['seconds'] = seconds
+    res['peak_bytes'] = peak
+    res['retained_bytes'] = current
+    res['gc_collections'] = sum(s['collections'] for s in gc.get_stats()) - collections
+    # instance without its (shared) frame, plus its __dict__ if it has one
+    res['instance_bytes'] = sys.getsizeof(items[0]) + sys.getsizeof(getattr(items[0], '__dict__', {})) if items else 0
+    res['new_classes'] = len(DataRaw.__subclasses__()) - classes
+    return res
+
+
+def measure(fn, *args, trace=True, **kwargs):
+    """Call fn, timing it and (if trace) tracing its peak memory
+
+    Args:
+        fn: function to call with args and kwargs
+        trace (bool): trace memory allocations (which slows the call)
+
+    Returns:
+        tuple: result of the call, seconds and peak traced memory (bytes,
+            None without trace)
+    """
+    gc.collect()
+    if trace:
+        tracemalloc.start()
+    t = time.time()
+    try:
+        res = fn(*args, **kwargs)
+        seconds = time.time() - t
+        peak = tracemalloc.get_traced_memory()[1] if trace else None
+    finally:
+        if trace:
+            tracemalloc.stop()
+    return res, seconds, peak
+
+
+def _inspector():
+    """inspector.py (next to the package) loaded as a module
+    (registered as inspector so that its functions can be sent to workers)"""
+    if 'inspector' in sys.modules:
+        return sys.modules['inspector']
+    path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'inspector.py')
+    module_spec = importlib.util.spec_from_file_location('inspector', path)
+    module = importlib.util.module_from_spec(module_spec)
+    sys.modules['inspector'] = module
+    module_spec.loader.exec_module(module)
+    return module
+
+
+def run_inspector(data_path, spec_path, results_path, *args):
+    """Run inspector.py on data_path as from the command line (with args)"""
+    inspector = _inspector()
+    argv = sys.argv
+    sys.argv = ['inspector.py', data_path, '-s', spec_path, '-t', results_path] + list(args)
+    try:
+        inspector.main(inspector.cli())
+    finally:
+        sys.argv = argv
+    return results_path
+
+
+def _make_misstb(items):
+    for item in items:
+        item.make_misstb()
+    return items
+
+
+def benchmark_scale(n_episodes, spec_path, workdir, fields=None, trace=True,
+                    inspector_args=(), **synthetic):
+    """Time (and trace memory of) each stage of ingestion and inspection for
+    n_episodes synthetic episodes
+
+    Stages are writing the synthetic JSON, loading it as a CCD, json2hdf,
+    loading the h5 store, extract_one and building a DataRaw for each field,
+    make_misstb for each DataRaw and a full inspector.py run on the store.
+
+    Args:
+        n_episodes (int): Episodes to generate
+        spec_path (str): Data specification
+        workdir (str): Directory for the JSON, h5 and inspector results
+        fields (list): Fields to extract and build (default those inspected)
+        trace (bool): Trace peak memory of each stage (slows them)
+        inspector_args (tuple): Extra command line arguments for inspector.py
+        synthetic: Further arguments for SyntheticCCD
+
+    Returns:
+        pd.DataFrame: episodes, stage, seconds and peak_bytes by stage
+    """
+    spec = load_spec(spec_path)
+    if fields is None:
+        fields = [k for k, v in spec.items() if v['Datatype'] in DATARAW_TYPES]
+    json_path = os.path.join(workdir, 'synthetic_{}.JSON'.format(n_episodes))
+    h5_path = os.path.join(workdir, 'synthetic_{}.h5'.format(n_episodes))
+    results_path = os.path.join(workdir, 'inspector_{}.csv'.format(n_episodes))
+
+    stages = OrderedDict()
+    def stage(name, fn, *args, **kwargs):
+        print('*** {} episodes: {}'.format(n_episodes, name))
+        res, seconds, peak = measure(fn, *args, trace=trace, **kwargs)
+        stages[name] = (seconds, peak)
+        return res
+
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        stage('synthetic', SyntheticCCD(spec, n_episodes=n_episodes, **synthetic).to_json, json_path)
+        ccd = stage('load_json', CCD, json_path, spec)
+        stage('json2hdf', ccd.json2hdf, path=h5_path, progress_marker=False)
+        del ccd
+        ccd = stage('load_h5', CCD, h5_path, spec)
+        stage('extract_one', lambda: [ccd.extract_one(k) for k in fields])
+        items = stage('dataraw', lambda: [DataRaw(k, ccd=ccd, spec=spec) for k in fields])
+        stage('make_misstb', _make_misstb, items)
+        del ccd, items
+        stage('inspector', run_inspector, h5_path, spec_path, results_path, *inspector_args)
+
+    res = pd.DataFrame([(n_episodes, k, s, p) for k, (s, p) in stages.items()],
+                       columns=['episodes', 'stage', 'seconds', 'peak_bytes'])
+    res['json_bytes'] = os.path.getsize(json_path)
+    return res
+
+
+def benchmark_suite(scales, spec_path, workdir=None, **kwargs):
+    """benchmark_scale for each number of episodes in scales
+
+    Args:
+        scales (list): Numbers of episodes
+        spec_path (str): Data specification
+        workdir (str): Directory for the files written (default a temporary
+            directory removed afterwards)
+        kwargs: Further arguments for benchmark_scale
+
+    Returns:
+        pd.DataFrame: rows of benchmark_scale for each scale
+    """
+    if workdir is None:
+        with tempfile.TemporaryDirectory() as tmp:
+            return benchmark_suite(scales, spec_path, tmp, **kwargs)
+    os.makedirs(workdir, exist_ok=True)
+    return pd.concat([benchmark_scale(n, spec_path, workdir, **kwargs) for n in scales],
+                     ignore_index=True)
+
+
+def main(args):
+    if args.scales:
+        res = benchmark_suite(args.scales, args.spec, workdir=args.workdir,
+                              trace=not args.no_trace, items_per_episode=args.items,
+                              density=args.density)
+        print(res.to_string(index=False))
+        if args.to:
+            res.to_csv(args.to, index=False)
+        return
+    if args.data_path is None:
+        raise ValueError("Give a data_path or --scales")
+    spec = load_spec(args.spec)
+    fields = [k for k, v in spec.items() if v['Datatype'] in DATARAW_TYPES]
+    ccd = CCD(args.data_path, spec)
+    # first call sets the DataRaw defaults
+    DataRaw(fields[0], ccd=ccd, spec=spec)
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        res = dataraw_memory(fields, ccd, spec, repeat=args.repeat)
+    for k, v in res.items():
+        print('*** {:<16} {}'.format(k, v))
+
+
+def cli():
+    ''' Command line interface for running script '''
+    parser = argparse.ArgumentParser(
+        description='Benchmark building DataRaw items for a CCD object, or with '
+                    '--scales ingestion and inspection of synthetic CCD objects'
+    )
+    parser.add_argument('data_path',
+                        nargs='?',
+                        default=None,
+                        help='JSON or hd5 file to be parsed')
+    parser.add_argument('-s', '--spec',
+                        default='N_DataItems.yml',
+                        help='Data specification')
+    parser.add_argument('-r', '--repeat',
+                        type=int,
+                        default=1,
+                        help='Build all the fields this many times')
+    parser.add_argument('--scales',
+                        type=int,
+                        nargs='+',
+                        default=None,
+                        help='Benchmark synthetic CCD objects with these numbers of episodes')
+    parser.add_argument('-w', '--workdir',
+                        default=None,
+                        help='Directory for the synthetic files (default temporary)')
+    parser.add_argument('-t', '--to',
+                        default=None,
+                        help='CSV file with the suite results')
+    parser.add_argument('-i', '--items',
+                        type=int,
+                        default=None,
+                        help='Fields held by each synthetic episode (default all)')
+    parser.add_argument('-d', '--density',
+                        type=float,
+                        default=1.,
+                        help='Mean 2d values per hour of stay')
+    parser.add_argument('--no-trace',
+                        action='store_true',
+                        help='Time the suite stages without tracing memory')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    main(cli())
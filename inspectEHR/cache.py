@@ -0,0 +1,94 @@
+import os
+import hashlib
+from collections import OrderedDict
+import pandas as pd
+
+
+class ItemCache:
+    """ LRU cache of typed item frames (as held by DataRaw.df)
+
+    Frames are keyed on the identity of the store they came from (path, size
+    and modification time, so a rewritten store is not served stale data), the
+    NHICcode, the byvar and the type they were converted to. The least recently
+    used frames are dropped once the memory held exceeds maxbytes. With a path,
+    frames are also pickled there so they survive eviction and the session.
+    Frames are copied (deep) in and out, so a caller editing a frame it put or
+    got does not change the cached frame.
+
+    Args:
+        maxbytes (int): Memory bound for frames held in memory
+        path (str): Directory for the on-disk tier (None for memory only)
+
+    Example:
+        cache = ItemCache(maxbytes=2**30, path='.inspectEHR_cache')
+        hr = DataRaw('NIHR_HIC_ICU_0108', ccd=ccd, spec=spec, cache=cache)
+    """
+
+    def __init__(self, maxbytes=2**30, path=None):
+        self.maxbytes = maxbytes
+        self.path = path
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._frames = OrderedDict()
+        if path is not None:
+            os.makedirs(path, exist_ok=True)
+
+    def __len__(self):
+        return len(self._frames)
+
+    def __contains__(self, key):
+        return key in self._frames or (self.path is not None and os.path.exists(self._file(key)))
+
+    @staticmethod
+    def key(ccd, NHICcode, byvar, fdtype):
+        """Cache key for an item of ccd"""
+        stat = os.stat(ccd.filepath)
+        return (os.path.abspath(ccd.filepath), stat.st_size, stat.st_mtime_ns,
+                NHICcode, byvar, fdtype)
+
+    def _file(self, key):
+        return os.path.join(self.path, hashlib.md5(repr(key).encode()).hexdigest() + '.pkl')
+
+    def get(self, key):
+        """Frame for key (None if not cached) from memory or else disk"""
+        if key in self._frames:
+            self._frames.move_to_end(key)
+            self.hits += 1
+            return self._frames[key][0].copy()
+        if self.path is not None and os.path.exists(self._file(key)):
+            df = pd.read_pickle(self._file(key))
+            self._keep(key, df)
+            self.hits += 1
+            return df.copy()
+        self.misses += 1
+        return None
+
+    def put(self, key, df):
+        """Cache df for key (written through to disk if there is a path)"""
+        if self.path is not None:
+            df.to_pickle(self._file(key))
+        self._keep(key, df.copy())
+
+    def _keep(self, key, df):
+        """Hold df in memory, evicting least recently used frames to fit"""
+        if key in self._frames:
+            self.nbytes -= self._frames.pop(key)[1]
+        nbytes = int(df.memory_usage(deep=True).sum())
+        if nbytes > self.maxbytes:
+            # too big to hold, but still available from disk if there is a path
+            return
+        self._frames[key] = (df, nbytes)
+        self.nbytes += nbytes
+        while self.nbytes > self.maxbytes:
+            _, (_, n) = self._frames.popitem(last=False)
+            self.nbytes -= n
+
+    def clear(self, disk=False):
+        """Empty the memory tier (and the disk tier too if disk)"""
+        self._frames.clear()
+        self.nbytes = 0
+        if disk and self.path is not None:
+            for f in os.listdir(self.path):
+                if f.endswith('.pkl'):
+                    os.remove(os.path.join(self.path, f))
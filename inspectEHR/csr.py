@@ -0,0 +1,111 @@
+import os
+import numpy as np
+import pandas as pd
+
+
+class CSRStore:
+    """ Memory mapped store of 2d items held CSR style.
+
+    Each 2d item is a directory of numpy arrays
+        codes.npy      - code of each value in categories (-1 if missing), in
+                         the smallest integer type that holds them
+        categories.npy - the distinct raw values (strings)
+        values.npy     - (numeric items only) the values as float64, NaN where
+                         missing or not numeric
+        time.npy       - matching times (timedelta64[ns])
+        eid.npy        - episode key (row of infotb) for each episode with data
+        offsets.npy    - episode i has codes[offsets[i]:offsets[i+1]]
+    which are opened with np.load(mmap_mode='r') (categories are read in
+    full). Processes reading the same store then share the operating system's
+    page cache rather than each holding a private copy of the arrays, and
+    to_frame (as used by CCD.extract_one) gives views of them rather than
+    copies.
+    infotb and item_1d (one row per episode or item) are kept as pickles.
+
+    Args:
+        path (str): Directory written by CSRStore.write (e.g. 'ccd.csr')
+    """
+
+    def __init__(self, path):
+        if not os.path.isdir(path):
+            raise ValueError("Path to CSR store not valid")
+        self.path = path
+        self.infotb = pd.read_pickle(os.path.join(path, 'infotb.pkl'))
+        self.item_1d = pd.read_pickle(os.path.join(path, 'item_1d.pkl'))
+        self.codes = sorted(d for d in os.listdir(os.path.join(path, 'item_2d')))
+        self._arrays = {}
+
+    def __contains__(self, nhic_code):
+        return nhic_code in self.codes
+
+    def item(self, nhic_code):
+        """Memory mapped arrays (codes, time, eid, offsets and values if
+        numeric) and categories for a 2d item"""
+        if nhic_code not in self._arrays:
+            if nhic_code not in self.codes:
+                return None
+            d = os.path.join(self.path, 'item_2d', nhic_code)
+            a = {k: np.load(os.path.join(d, k + '.npy'), mmap_mode='r')
+                 for k in ['codes', 'time', 'eid', 'offsets']}
+            if os.path.exists(os.path.join(d, 'values.npy')):
+                a['values'] = np.load(os.path.join(d, 'values.npy'), mmap_mode='r')
+            a['categories'] = pd.Index(np.load(os.path.join(d, 'categories.npy')), dtype=object)
+            self._arrays[nhic_code] = a
+        return self._arrays[nhic_code]
+
+    def to_frame(self, nhic_code):
+        """Long data for a 2d item with columns item2d, time, site_id and eid
+        (item2d a categorical of the raw values and time, views of the arrays)"""
+        a = self.item(nhic_code)
+        if a is None:
+            a = {'codes': np.array([], dtype='int8'), 'categories': pd.Index([], dtype=object),
+                 'time': np.array([], dtype='m8[ns]'), 'eid': np.array([], dtype=int),
+                 'offsets': np.zeros(1, dtype=int)}
+        eid = np.repeat(a['eid'], np.diff(a['offsets']))
+        return pd.DataFrame({'item2d': pd.Categorical.from_codes(a['codes'], categories=a['categories']),
+                             'time': a['time'],
+                             'site_id': self.infotb['site_id'].values[eid],
+                             'eid': eid},
+                            columns=['item2d', 'time', 'site_id', 'eid'], copy=False)
+
+    @staticmethod
+    def write(path, infotb, item_1d, item_2d, numeric=()):
+        """Write a CSR store from the long tables prepared for h5
+        Args:
+            path: directory to write to (created if needed)
+            infotb: episode table with eid (its row number) and site_id
+            item_1d: long 1d data
+            item_2d: long 2d data with NHICcode, item2d, time and eid, sorted by
+                NHICcode with each episode's values for an item contiguous
+            numeric: NHICcodes of numeric items (also stored as float64)
+        """
+        os.makedirs(os.path.join(path, 'item_2d'), exist_ok=True)
+        infotb.to_pickle(os.path.join(path, 'infotb.pkl'))
+        item_1d.to_pickle(os.path.join(path, 'item_1d.pkl'))
+
+        for nhic_code, df in item_2d.groupby('NHICcode', sort=False, observed=True):
+            eid = df['eid'].values
+            starts = np.flatnonzero(np.r_[True, eid[1:] != eid[:-1]])
+            d = os.path.join(path, 'item_2d', str(nhic_code))
+            os.makedirs(d, exist_ok=True)
+            # values as str so that e.g. 1 and '1' share a category
+            values = df['item2d'].where(df['item2d'].isnull(), df['item2d'].astype(str))
+            codes, categories = pd.factorize(values)
+            np.save(os.path.join(d, 'codes.npy'), codes.astype(_codes_dtype(len(categories))))
+            np.save(os.path.join(d, 'categories.npy'), np.asarray(categories, dtype=str))
+            if str(nhic_code) in numeric:
+                converted = pd.to_numeric(pd.Series(categories, dtype=object), errors='coerce')
+                # code -1 (missing) picks the NaN on the end
+                np.save(os.path.join(d, 'values.npy'), np.r_[converted.values.astype('float64'), np.nan][codes])
+            np.save(os.path.join(d, 'time.npy'), df['time'].values.astype('timedelta64[ns]'))
+            np.save(os.path.join(d, 'eid.npy'), eid[starts])
+            np.save(os.path.join(d, 'offsets.npy'), np.r_[starts, len(eid)])
+
+
+def _codes_dtype(n):
+    """Integer type pd.Categorical holds the codes of n categories in (codes
+    saved in it are not cast, so are read as views)"""
+    for t in [np.int8, np.int16, np.int32]:
+        if n < np.iinfo(t).max:
+            return t
+    return np.int64
@@ -7,10 +7,19 @@ import matplotlib.pyplot as plt
 from collections import OrderedDict
 import warnings
 
+from inspectEHR.sketch import ContSummary, EXACT_SIZE
+from inspectEHR.utils import segment_times, timedelta_to_ns, timedelta_from_ns
+from inspectEHR.utils import parse_reference_range, range_counts, RANGE_COLUMNS
+from inspectEHR.utils import parse_datetimes, to_numeric_unique, DATETIME_FORMATS
+from inspectEHR.utils import episode_positions
+
 
 
 class AutoMixinMeta(type):
     # https://stackoverflow.com/a/28205308/992999
+    # - [ ] @NOTE: the class combining a base and mixin is built once and kept
+    #   (as a module global so instances pickle) rather than on every call
+    _mixin_classes = {}
 
     def __call__(cls, *args, **kwargs):
         # - [ ] @TODO: (2017-07-16) allow just 4 digit version of code
@@ -18,14 +27,11 @@ class AutoMixinMeta(type):
         NHICcode = args[0]
 
         # get field dictionary
-        try:
-            _spec = getattr(DataRaw, 'spec')
-            # fspec = DataRaw.spec[NHICcode]
-        except AttributeError as e:
-            try:
-                _spec = kwargs['spec']
-            except KeyError as e:
+        _spec = kwargs.get('spec')
+        if _spec is None:
+            if DataRaw._defaults is None:
                 raise KeyError('!!! Data dictionary (fspec) not provided as keyword argument')
+            _spec = DataRaw._defaults['spec']
 
         # get field spec
         try:
@@ -39,7 +45,7 @@ class AutoMixinMeta(type):
                 mixin = ContMixin
             elif fspec['Datatype'] in ['text', 'list', 'list / logical', 'Logical']:
                 mixin = CatMixin
-            elif fspec['Datatype'] in ['Date', 'Time', 'Date/time']:
+            elif fspec['Datatype'].lower() in ['date', 'time', 'date/time']:
                 mixin = DateTimeMixin
             else:
                 raise ValueError
@@ -48,10 +54,20 @@ class AutoMixinMeta(type):
         except ValueError:
             raise ValueError('!!! Datatype field not recognised')
 
-        name = "{}With{}".format(cls.__name__, mixin.__name__)
-        cls = type(name, (cls, mixin), dict(cls.__dict__))
+        return type.__call__(AutoMixinMeta._mixin_class(cls, mixin), *args, **kwargs)
+
+    @staticmethod
+    def _mixin_class(cls, mixin):
+        """Class combining cls and mixin (created on first use)"""
+        try:
+            return AutoMixinMeta._mixin_classes[cls, mixin]
+        except KeyError:
+            name = "{}With{}".format(cls.__name__, mixin.__name__)
+            # bypass AutoMixinMeta.__call__ when instances are copied or unpickled
+            new = type(name, (cls, mixin), {'__slots__': (), '__module__': __name__})
+            globals()[name] = AutoMixinMeta._mixin_classes[cls, mixin] = new
+            return new
 
-        return type.__call__(cls, *args, **kwargs)
 
 class DataRaw(object, metaclass=AutoMixinMeta):
     """ Initiate and check dataframe with correct rows and dimensions.
@@ -62,36 +78,51 @@ class DataRaw(object, metaclass=AutoMixinMeta):
         NHICcode:
         ccd:
         spec: data dictionary
+        df: data for the item as from ccd.extract_one (extracted if None)
+        cache: ItemCache of typed item frames (the first one given is kept
+            as a default for later calls)
     """
 
-    # - [ ] @NOTE: (2017-07-20) these values will persist for this instance
-    _first_run = True
+    # - [ ] @NOTE: (2017-07-20) ccd and spec from the first call are kept as
+    #   defaults for later calls; each instance holds its own references
+    _defaults = None
     _foo = 0
+    # no per instance __dict__ as hundreds of items may be held at once
+    __slots__ = ('ccd', 'spec', 'infotb', 'ccd_key', 'cache', 'NHICcode', 'byvar',
+                 'fspec', 'fdtype', 'label', 'categories', 'bylevels', 'id_nunique',
+                 'd1d', 'd2d', 'df', 'nrow', 'ncol', 'coerced_values')
 
     def __init__(self, NHICcode, ccd=None, spec=None, byvar='site_id',
-            ccd_key=['site_id', 'episode_id'], first_run = False):
+            ccd_key=['site_id', 'episode_id'], first_run = False, df=None, cache=None):
         """Initiate and create a data frame for the specific items"""
 
         # if initial call (either by default, or explicitly)
-        if DataRaw._first_run or first_run:
-            if ccd is None or spec is None:
-                raise ValueError("First call requires ccd and spec args")
-            else:
+        if ccd is not None and spec is not None:
+            if DataRaw._defaults is None or first_run:
                 print('*** First initialisation of DataRaw class')
-                setattr(DataRaw,  'ccd', ccd )
-                setattr(DataRaw,  'infotb', ccd.infotb )
-                setattr(DataRaw,  'spec', spec )
-                if not all([k in self.infotb.columns for k in ccd_key]):
-                    raise KeyError('!!! ccd_key should be a list of column names')
-                else:
-                    setattr(DataRaw,  'ccd_key', ccd_key)
-                DataRaw._first_run = False
-                print('*** Class variables ccd and spec initiated')
+                DataRaw._defaults = {'ccd': ccd, 'spec': spec, 'cache': cache}
+        elif DataRaw._defaults is None or first_run:
+            raise ValueError("First call requires ccd and spec args")
+        else:
+            ccd = ccd if ccd is not None else DataRaw._defaults['ccd']
+            spec = spec if spec is not None else DataRaw._defaults['spec']
+
+        # Instance (not class) state so items can be inspected independently
+        # e.g. in worker processes
+        self.ccd        = ccd
+        self.spec       = spec
+        self.infotb     = ccd.infotb
+        if not all([k in self.infotb.columns for k in ccd_key]):
+            raise KeyError('!!! ccd_key should be a list of column names')
+        self.ccd_key    = list(ccd_key)
+        if cache is None and DataRaw._defaults is not None:
+            cache = DataRaw._defaults.get('cache')
+        self.cache      = cache
 
         # Define instance characteristics
         self.NHICcode   = NHICcode
         self.byvar      = byvar
-        self.fspec      = DataRaw.spec[NHICcode]
+        self.fspec      = self.spec[NHICcode]
         self.fdtype     = self._datatype_to_pandas(self.fspec['Datatype'])
         self.label      = self.fspec['dataItem']
         self.categories = None
@@ -105,28 +136,69 @@ class DataRaw(object, metaclass=AutoMixinMeta):
 
 
         # Generate and prepare data
-        # Grab the variable from ccd
-        self.df = DataRaw.ccd.extract_one(NHICcode, by=self.byvar)
+        # Grab the variable from the cache (already typed) or else from ccd
+        # (unless already extracted e.g. by from_many)
+        typed = False
+        if self.cache is not None:
+            cache_key = self.cache.key(self.ccd, NHICcode, self.byvar, self.fdtype)
+            if df is None:
+                df = self.cache.get(cache_key)
+                typed = df is not None
+        if df is None:
+            df = self.ccd.extract_one(NHICcode, by=self.byvar)
+        self.df = df
         self.nrow, self.ncol = self.df.shape
 
         # Convert to correct type and record data quality
-        self.coerced_values = pd.Series([], dtype='str')
-
-        # Convert type (and store original)
-        self.df.rename(columns={'value': 'value_orig'})
         # type conversion throws silent error if no data
         if self.nrow > 0:
-            self.df.value = self._convert_type(self.df.value, fdtype=self.fdtype)
+            if not typed:
+                vals, value_orig = self._convert_type(self.df.value, fdtype=self.fdtype,
+                                                      fmt=self._datetime_format(self.fspec))
+                self.df['value'] = vals
+                if value_orig is not None:
+                    # store original of values coerced to missing
+                    self.df['value_orig'] = value_orig
             self.bylevels = self.df.byvar.unique()
             # Count unique levels of index id
             self.id_nunique = self.df.index.nunique()
             if self.fdtype == 'category':
                 self.categories = self.df.value.cat.categories
+        if self.cache is not None and not typed:
+            self.cache.put(cache_key, self.df)
+        self.coerced_values = self.df['value_orig'].dropna() if 'value_orig' in self.df.columns \
+            else pd.Series([], dtype='str')
 
         # class variable demo
         DataRaw._foo += 1
 
 
+    @classmethod
+    def from_many(cls, NHICcodes, ccd=None, spec=None, byvar='site_id', **kwargs):
+        """Create a DataRaw for each of several items
+        Data are extracted together with ccd.extract_many (one scan of a JSON)
+        except for items already in the cache
+
+        Returns:
+            list: DataRaw objects in the order of NHICcodes
+        """
+        _ccd, _spec = ccd, spec
+        if _ccd is None or _spec is None:
+            if DataRaw._defaults is None:
+                raise ValueError("First call requires ccd and spec args")
+            _ccd = _ccd if _ccd is not None else DataRaw._defaults['ccd']
+            _spec = _spec if _spec is not None else DataRaw._defaults['spec']
+        cache = kwargs.get('cache')
+        if cache is None and DataRaw._defaults is not None:
+            cache = DataRaw._defaults.get('cache')
+        if cache is not None:
+            todo = [k for k in NHICcodes if cache.key(_ccd, k, byvar,
+                    cls._datatype_to_pandas(_spec[k]['Datatype'])) not in cache]
+        else:
+            todo = NHICcodes
+        dfs = _ccd.extract_many(todo, by=byvar) if todo else {}
+        return [cls(k, ccd=ccd, spec=spec, byvar=byvar, df=dfs.get(k), **kwargs) for k in NHICcodes]
+
     def __len__(self):
         return len(self.df)
 
@@ -155,68 +227,94 @@ class DataRaw(object, metaclass=AutoMixinMeta):
             fdtype = 'str'
         elif s in ['list', 'list / logical', 'Logical']:
             fdtype = 'category' # pd.Categorical
-        elif s in ['Date', 'Time', 'Date/time']:
+        elif s.lower() in ['date', 'time', 'date/time']:
             fdtype = 'datetime64'
         else:
             raise ValueError('!!! field specification datatype not recognised')
         return fdtype
 
     @staticmethod
-    def _convert_type(vals, fdtype):
-        """Convert data to specified type."""
+    def _datetime_format(fspec):
+        """strftime format of a date/time field from its spec Template
+        (None for other fields)"""
+        if fspec['Datatype'].lower() not in ['date', 'time', 'date/time']:
+            return None
+        return DATETIME_FORMATS.get(fspec.get('Template'), DATETIME_FORMATS[fspec['Datatype'].lower()])
+
+    @staticmethod
+    def _convert_type(vals, fdtype, fmt=None):
+        """Convert data to specified type.
+        Numbers, and dates and times (with the explicit format fmt), are
+        converted once for each distinct raw value and broadcast back
+
+        Returns:
+            tuple: converted values and the raw values that were coerced to
+                missing (pd.Categorical, NaN for the others) or None if no
+                conversion was attempted
+        """
         # Turn off modification of slice warnings
         pd.options.mode.chained_assignment = None  # default='warn'
 
+        value_orig = None
         if fdtype == 'float':
-            # must use NaN not None below
-            vals = vals.replace(' ', np.NaN)
-            vals = pd.to_numeric(vals, errors='coerce', downcast='integer')
+            vals, _, value_orig = to_numeric_unique(vals, keep_coerced=True)
+            vals = pd.to_numeric(vals, downcast='integer')
         elif fdtype == 'str':
             # no change required as should be text by default
             pass
         elif fdtype == 'category':
             vals = pd.Categorical(vals)
-        elif fdtype == 'datatime64':
-            pass
+        elif fdtype == 'datetime64':
+            vals, _, value_orig = parse_datetimes(vals, fmt, keep_coerced=True)
         else:
             raise ValueError('!!! field specification datatype not recognised')
 
         # Restore annoying warnings
         pd.options.mode.chained_assignment = 'warn'  # default='warn'
 
-        # Python convention to return None if changing in place
-        return vals
+        return vals, value_orig
 
     @staticmethod
-    def _not_numeric(v):
-        """Returns an array of those the values in s that are coerced"""
-        mask_orig = v.isnull()
-        mask_coerce = pd.to_numeric(v, errors='coerce', downcast='integer').isnull()
-        return v.loc[np.logical_and(mask_coerce, np.logical_not(mask_orig))]
+    def _coerced(df):
+        """Flags for the values of df that were coerced to missing
+        (recorded as value_orig by _convert_type)"""
+        if 'value_orig' in df.columns:
+            return df['value_orig'].notnull()
+        return pd.Series(False, index=df.index)
 
 
     def make_misstb(self, bylevel=None, verbose=False):
-        """Define missingness per episode including time dependent measures"""
+        """Define missingness per episode including time dependent measures
+        Presence, first and last time and median gap come from one pass over
+        the data (_episode_summary) which is aligned to infotb once"""
 
         # Permits a subsetted df to be passed
         if bylevel is None:
             _df = self.df
-            _infotb = DataRaw.infotb
+            _infotb = self.infotb
         else:
             # filter df and infotb by byvar
             _df = self.df.loc[self.df.byvar==bylevel]
-            _infotb = DataRaw.infotb[DataRaw.infotb[self.byvar]==bylevel]
-
-        misstb = self._miss_by_episode(_infotb, _df, self.ccd_key)
-
-        if self.d2d and len(_df) > 0:
-            gap_start = self._gap_start(_infotb, _df, self.ccd_key)
-            misstb = pd.merge(misstb, gap_start.reset_index(), on=self.ccd_key, how='left')
-            gap_stop = self._gap_stop(_infotb, _df, self.ccd_key)
-            misstb = pd.merge(misstb, gap_stop.reset_index(), on=self.ccd_key, how='left')
-            gap_period = self._gap_period(_df, self.ccd_key)
-            misstb = pd.merge(misstb, gap_period.reset_index(), on=self.ccd_key, how='left')
-
+            _infotb = self.infotb[self.infotb[self.byvar]==bylevel]
+
+        ke = self.ccd_key
+        summary = self._episode_summary(_df, ke)
+        keys = pd.MultiIndex.from_frame(_infotb[ke])
+        episode_positions(keys, summary.index)  # checks every episode is in infotb
+        pos = summary.index.get_indexer(keys)
+        found = pos >= 0
+
+        misstb = _infotb[ke].reset_index(drop=True)
+        misstb['miss_by_episode'] = ~found
+
+        # @NOTE: daily items (e.g. 0931) have an NHICdtCode but are extracted as 1d
+        if self.d2d and len(_df) > 0 and 'time' in _df:
+            for col, tcol in [('gap_start', 't_admission'), ('gap_stop', 't_discharge'), ('gap_period', None)]:
+                v = np.full(len(pos), np.timedelta64('NaT'), dtype='m8[ns]')
+                v[found] = summary[col].values[pos[found]]
+                if tcol is not None:
+                    v = v - _infotb[tcol].values
+                misstb[col] = v
 
         if verbose:
             print('*** Missing data table saved as self.misstb\ne.g.\n')
@@ -225,61 +323,46 @@ class DataRaw(object, metaclass=AutoMixinMeta):
         return misstb
 
 
-    @staticmethod
-    def _miss_by_episode(infotb, df, ke):
-        """Report if any data available for each episode in infotb
-        Args:
-            ke: key columns for infotb
-            infotb:
-            df: dataframe of 1d or 2d data
-        Yields:
-            dataframe with key cols and boolean if present in data
-        """
-        res = infotb[ke]
-        df_episodes = df[ke].drop_duplicates()
-        res = pd.merge(res, df_episodes, on=ke,  how='left', indicator=True)
-        # there's shouldn't be an index in the data that is not in infotb
-        assert len(res[res['_merge']=='right_only']) == 0
-        res.loc[res._merge == 'both', 'miss_by_episode'] = False
-        res.loc[res._merge == 'left_only', 'miss_by_episode'] = True
-        res.drop('_merge', axis=1, inplace=True)
-        return res
-
-    @staticmethod
-    def _gap_start(infotb, df, ke, tstart = 't_admission'):
-        """Report delay before first 2d observation"""
-        tmin = df.groupby(by=ke).time.min().reset_index()
-        cols = ke.copy()
-        cols.append(tstart)
-        res = infotb[cols]
-        res = pd.merge(res, tmin , on=ke,  how='left')
-        res['gap_start'] = res.time - res[tstart]
-        return res.set_index(ke).gap_start
-
-    @staticmethod
-    def _gap_stop(infotb, df, ke, tstop = 't_discharge'):
-        """Report delay after last 2d observation"""
-        tmax = df.groupby(by=ke).time.max().reset_index()
-        cols = ke.copy()
-        cols.append(tstop)
-        res = infotb[cols]
-        res = pd.merge(res, tmax , on=ke,  how='left')
-        res['gap_stop'] = res.time - res[tstop]
-        return res.set_index(ke).gap_stop
+    def _misstb_by(self):
+        """Mean missingness and gaps for every bylevel from a single misstb
+        Equivalent to make_misstb(bylevel).mean() for each level in self.bylevels"""
+        misstb = self.make_misstb(bylevel=None, verbose=False)
+        cols = list(misstb.loc[:, 'miss_by_episode':].columns)
+        by = self.infotb[self.byvar].values
+        res = OrderedDict()
+        for col in cols:
+            v = misstb[col]
+            if ptypes.is_timedelta64_dtype(v):
+                # (grouped mean drops timedelta columns) so average as ns
+                ns = pd.Series(v.values.astype('i8').astype(float)).where(v.notnull().values)
+                res[col] = pd.to_timedelta(ns.groupby(by).mean(), unit='ns')
+            else:
+                res[col] = pd.Series(v.values.astype(float)).groupby(by).mean()
+        return pd.DataFrame(res, columns=cols).reindex(list(self.bylevels))
 
     @staticmethod
-    def _gap_period(df, ke, method=np.median):
-        """Define (median) periodicity of measurement in hours"""
-        # - [ ] @NOTE: (2017-07-21) working with diff() v slow
-        # therefore manually shift and calculate
-        res = df.copy()
-        res['time_L1'] = res.groupby(ke).time.shift()
-        res['gap_period'] = res['time'] - res['time_L1']
-        res = res.groupby(ke).gap_period.apply(method)
-        return res
+    def _episode_summary(df, ke):
+        """First and last time and (median) periodicity of each episode in df
+        Sorts once by episode and time then reduces each episode as a segment
+        Returns:
+            dataframe indexed by ke with gap_start, gap_stop (first and last
+            time, before subtracting admission and discharge) and gap_period
+        """
+        grouped = df.groupby(ke, observed=True)
+        index = pd.MultiIndex.from_frame(grouped.size().index.to_frame(index=False))
+        if 'time' not in df:
+            return pd.DataFrame(index=index)
+        tmin, tmax, gap = segment_times(timedelta_to_ns(df['time'].values),
+                                        grouped.ngroup().values, grouped.ngroups)
+        res = OrderedDict()
+        res['gap_start'] = timedelta_from_ns(tmin)
+        res['gap_stop'] = timedelta_from_ns(tmax)
+        res['gap_period'] = timedelta_from_ns(gap)
+        return pd.DataFrame(res, index=index)
 
 class CatMixin:
     ''' Categorical data methods'''
+    __slots__ = ()
 
     def inspect(self, by=False):
         """Inspection optionally using byvar"""
@@ -302,10 +385,16 @@ class CatMixin:
         return _df.value.value_counts()
 
     def inspect_row(self, by=False):
-        """Public version that handles by argument"""
+        """Public version that handles by argument
+        With by, all bylevels are reported from one misstb and one count of
+        the levels rather than filtering for each level"""
         if by and len(self.df):
-            # dict comprehension and return as dataframe
-            res = [self._inspect_row(bylevel=bylevel) for bylevel in self.bylevels]
+            row_miss = self._misstb_by()
+            g, bylevels = pd.factorize(np.asarray(self.df['byvar'], dtype=object))
+            counts, sizes, nunique = self._level_counts(self.df['value'], g, len(bylevels))
+            res = [self._rows(bylevel, sizes[i], nunique[i], None if counts is None else counts[i],
+                              row_miss.loc[bylevel])
+                   for i, bylevel in enumerate(bylevels)]
             return pd.concat(res)
         else:
             return self._inspect_row(bylevel=None)
@@ -322,23 +411,43 @@ class CatMixin:
             _df = self.df.loc[self.df.byvar==bylevel]
 
         misstb = self.make_misstb(bylevel=bylevel, verbose=False)
+        row_miss = misstb.loc[:,'miss_by_episode':].mean()
+        counts, sizes, nunique = self._level_counts(_df['value'], np.zeros(len(_df), dtype=int), 1)
+        return self._rows(bylevel, sizes[0], nunique[0], None if counts is None else counts[0], row_miss)
 
+    @staticmethod
+    def _level_counts(vals, g, ngroups):
+        """Count each category of vals (columns) within each group g (rows)
+        with one bincount of the categorical codes
+        Returns:
+            tuple: counts (None if vals not categorical), sizes and nunique
+        """
+        sizes = np.bincount(g, minlength=ngroups)
+        if not ptypes.is_categorical_dtype(vals):
+            nunique = vals.groupby(g).nunique().reindex(range(ngroups), fill_value=0).values
+            return None, sizes, nunique
+        codes = vals.cat.codes.values
+        ncat = len(vals.cat.categories)
+        ok = codes >= 0
+        counts = np.bincount(g[ok] * ncat + codes[ok], minlength=ngroups * ncat).reshape(ngroups, ncat)
+        return counts, sizes, (counts > 0).sum(axis=1)
+
+    def _rows(self, bylevel, size, nunique, counts, row_miss):
+        '''Header and level rows for one bylevel (or all) from the level counts'''
         # Mini data frame with levels and missingness
         rows = []
         row_keys = ['NHICcode', self.byvar, 'level', 'count', 'n', 'pct', 'nunique', 'miss_by_episode', 'gap_start', 'gap_stop', 'gap_period']
         row = OrderedDict.fromkeys(row_keys)
-        vals = _df['value']
 
         # Header row
         # ==========
         row['NHICcode'] = self.NHICcode
         row[self.byvar] = bylevel
         row['level'] = 'header'
-        row['nunique'] = vals.nunique()
-        row['count'] = len(vals)
+        row['nunique'] = nunique
+        row['count'] = size
         row['coerced'] = None # b/c categorical and no type conversion attempted
 
-        row_miss = misstb.loc[:,'miss_by_episode':].mean()
         # for some reason, can't write this as a list comprehension
         for k,v in row_miss.iteritems():
             row[k] = v
@@ -347,19 +456,20 @@ class CatMixin:
 
         # now repeat for levels of variable
         # =================================
-        try:
-            for lvl in vals.cat.categories:
-                row = OrderedDict.fromkeys(row_keys)
-                # Header row
-                row['NHICcode'] = self.NHICcode
-                row[self.byvar] = bylevel
-                row['level'] = lvl
-                row['n'] = vals.loc[vals == lvl].count()
-                row['pct'] = row['n'] / len(vals)
-                rows.append(pd.Series(row))
-        except AttributeError as e:
+        if counts is None:
             # if vals is zero length then will not have categories
-            warnings.warn('\n!!! Unable to parse categories of {} holding {} values'.format(self.NHICcode, len(vals)))
+            warnings.warn('\n!!! Unable to parse categories of {} holding {} values'.format(self.NHICcode, size))
+            return pd.DataFrame(rows)
+
+        for lvl, n in zip(self.df['value'].cat.categories, counts):
+            row = OrderedDict.fromkeys(row_keys)
+            # Header row
+            row['NHICcode'] = self.NHICcode
+            row[self.byvar] = bylevel
+            row['level'] = lvl
+            row['n'] = n
+            row['pct'] = row['n'] / size
+            rows.append(pd.Series(row))
 
         return pd.DataFrame(rows)
 
@@ -385,6 +495,7 @@ class CatMixin:
 
 class ContMixin:
     ''' Continuous data methods '''
+    __slots__ = ()
 
     def inspect(self, by=False):
         """Inspection optionally using byvar"""
@@ -406,16 +517,47 @@ class ContMixin:
 
         return _df.value.describe()
 
-    def inspect_row(self, by=False):
-        """Public version that handles by argument"""
+    def summarise(self, by=False, delta=100, exact=EXACT_SIZE):
+        """Mergeable summaries (ContSummary) of the values
+        which can be combined with those of other chunks or sites
+        (quartiles are exact for levels with at most exact values)
+        Returns:
+            OrderedDict: bylevel (None unless by) to ContSummary
+        """
         if by and len(self.df):
-            # dict comprehension and return as dataframe
-            res = [self._inspect_row(bylevel=bylevel) for bylevel in self.bylevels]
-            return pd.concat(res)
+            g, bylevels = pd.factorize(np.asarray(self.df['byvar'], dtype=object))
+            # sort by level once so each level's values are a contiguous slice
+            vals = np.asarray(self.df['value'], dtype=float)[np.argsort(g, kind='mergesort')]
+            offsets = np.r_[0, np.cumsum(np.bincount(g, minlength=len(bylevels)))]
+            return OrderedDict((bylevel, ContSummary.from_values(vals[offsets[i]:offsets[i + 1]], delta, exact))
+                               for i, bylevel in enumerate(bylevels))
+        return OrderedDict([(None, ContSummary.from_values(np.asarray(self.df['value'], dtype=float), delta, exact))])
+
+    def inspect_row(self, by=False, exact=True):
+        """Public version that handles by argument
+        With by, all bylevels are summarised with one grouped aggregation
+        Unless exact, statistics come from summarise (approximate quartiles)"""
+        if by and len(self.df):
+            grouped = self.df.groupby('byvar', sort=False, observed=True)['value']
+            coerced = self._coerced(self.df)
+            if exact:
+                stats = grouped.describe()
+            else:
+                stats = pd.DataFrame({k: v.describe() for k, v in self.summarise(by=True).items()}).T
+            g, bylevels = pd.factorize(np.asarray(self.df['byvar'], dtype=object))
+            res = pd.concat([
+                    coerced.groupby(self.df['byvar'], sort=False, observed=True).sum().rename('coerced_values'),
+                    stats,
+                    self._validate(self.df['value'], g, bylevels),
+                    self._misstb_by()
+            ], axis=1).reindex(list(self.bylevels))
+            res.insert(0, self.byvar, res.index)
+            res.insert(0, 'NHICcode', self.NHICcode)
+            return res.reset_index(drop=True)
         else:
-            return self._inspect_row(bylevel=None)
+            return self._inspect_row(bylevel=None, exact=exact)
 
-    def _inspect_row(self, bylevel=None):
+    def _inspect_row(self, bylevel=None, exact=True):
         ''' Summarise data (if numerical)
         includes mean gap data (but median might be more appropriate)'''
 
@@ -427,19 +569,29 @@ class ContMixin:
             _df = self.df.loc[self.df.byvar==bylevel]
 
         misstb = self.make_misstb(bylevel=bylevel, verbose=False)
-        coerced_values = self._not_numeric(_df.value)
 
         res = pd.concat([
                 pd.Series(
-                        [self.NHICcode, bylevel, len(coerced_values)],
+                        [self.NHICcode, bylevel, self._coerced(_df).sum()],
                         index=['NHICcode', self.byvar, 'coerced_values']),
-                _df['value'].describe(),
+                _df['value'].describe() if exact else
+                ContSummary.from_values(np.asarray(_df['value'], dtype=float)).describe(),
+                self._validate(_df['value'], np.zeros(len(_df), dtype=int), [bylevel]).iloc[0],
                 misstb.loc[:,'miss_by_episode':].mean()
         ])
         # although single row, return as dataframe for consistency with cat version
         # and transpose so wide not long
         return pd.DataFrame(res).T
 
+    def _validate(self, vals, g, bylevels):
+        """Counts of vals below, within and above the spec Reference_ranges
+        for each group g (empty if the field has no range)"""
+        bounds = parse_reference_range(self.fspec.get('Reference_ranges'))
+        if bounds is None:
+            return pd.DataFrame(index=bylevels)
+        counts = range_counts(np.asarray(vals, dtype=float), g, len(bylevels), *bounds)
+        return pd.DataFrame(counts, index=bylevels, columns=RANGE_COLUMNS)
+
     def plot(self, by=False, **kwargs):
         if by:
             for name, grp in self.df.groupby('byvar'):
@@ -451,8 +603,95 @@ class ContMixin:
 
 class DateTimeMixin:
     ''' Date/Time methods'''
-    pass
+    __slots__ = ()
+
+    def inspect(self, by=False):
+        """Inspection optionally using byvar"""
+        if by:
+            # dict comprehension and return as dataframe
+            res = {bylevel:self._inspect(bylevel=bylevel) for bylevel in self.bylevels}
+            return pd.DataFrame(res)
+        else:
+            return self._inspect(bylevel=None)
+
+    def _inspect(self, bylevel=None):
+        """Simple inspection by a single level or all"""
+        if bylevel is None:
+            _df = self.df
+        else:
+            # filter df  by byvar
+            _df = self.df.loc[self.df.byvar==bylevel]
+
+        return self._summary(_df, np.zeros(len(_df), dtype=int), [bylevel]).iloc[0]
+
+    def inspect_row(self, by=False):
+        """Public version that handles by argument
+        With by, all bylevels are summarised together"""
+        if by and len(self.df):
+            g, bylevels = pd.factorize(np.asarray(self.df['byvar'], dtype=object))
+            res = pd.concat([
+                    self._summary(self.df, g, bylevels),
+                    self._misstb_by()
+            ], axis=1).reindex(list(self.bylevels))
+            res.insert(0, self.byvar, res.index)
+            res.insert(0, 'NHICcode', self.NHICcode)
+            return res.reset_index(drop=True)
+        else:
+            return self._inspect_row(bylevel=None)
+
+    def _inspect_row(self, bylevel=None):
+        ''' Summarise dates or times with missingness'''
+
+        # Permits a subsetted df to be passed
+        if bylevel is None:
+            _df = self.df
+        else:
+            # filter df  by byvar
+            _df = self.df.loc[self.df.byvar==bylevel]
+
+        misstb = self.make_misstb(bylevel=bylevel, verbose=False)
+        res = pd.concat([
+                pd.Series([self.NHICcode, bylevel], index=['NHICcode', self.byvar]),
+                self._summary(_df, np.zeros(len(_df), dtype=int), [bylevel]).iloc[0],
+                misstb.loc[:,'miss_by_episode':].mean()
+        ])
+        return pd.DataFrame(res).T
+
+    def _summary(self, df, g, bylevels):
+        """Count, range and the number of values flagged by _checks for each
+        group g (indexed by bylevels)"""
+        vals = df['value']
+        ngroups = len(bylevels)
+        res = pd.DataFrame({'count': np.bincount(g[vals.notnull().values], minlength=ngroups)})
+        res['coerced_values'] = np.bincount(g[self._coerced(df).values], minlength=ngroups)
+        grouped = vals.groupby(g)
+        res['min'] = grouped.min().reindex(range(ngroups))
+        res['max'] = grouped.max().reindex(range(ngroups))
+        for col, flag in self._checks(df).items():
+            res[col] = np.bincount(g[flag], minlength=ngroups)
+        res.index = bylevels
+        return res
+
+    def _checks(self, df):
+        """Flags for values in the future and, for dates, before the admission
+        or after the discharge of their episode (t_admission and t_discharge
+        are seconds since the epoch). Times of day are not flagged."""
+        vals = df['value'].values
+        res = OrderedDict()
+        if not np.issubdtype(vals.dtype, np.datetime64):
+            return res
+        res['future'] = vals > np.datetime64(pd.Timestamp.now())
+        pos = episode_positions(self.ccd.episode_ids(), df.index)
+        epoch = np.datetime64(0, 'ns')
+        admission = epoch + self.infotb['t_admission'].values[pos]
+        discharge = epoch + self.infotb['t_discharge'].values[pos]
+        # dates (without a time) are compared to the day of admission
+        unit = 'ns' if '%H' in self._datetime_format(self.fspec) else 'D'
+        vals = vals.astype('M8[{}]'.format(unit))
+        res['before_admission'] = vals < admission.astype('M8[{}]'.format(unit))
+        res['after_discharge'] = vals > discharge.astype('M8[{}]'.format(unit))
+        return res
 
 class TextMixin:
     ''' Text methods'''
-    pass
+    __slots__ = ()
@@ -0,0 +1,516 @@
+import warnings
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+
+from inspectEHR.data_classes import DataRaw
+from inspectEHR.sketch import ContSummary
+from inspectEHR.utils import segment_times, timedelta_to_ns, timedelta_from_ns, sorted_join
+from inspectEHR.utils import episode_positions
+from inspectEHR.utils import reference_ranges, range_counts, RANGE_COLUMNS
+from inspectEHR.utils import to_numeric_unique, COERCED
+
+DESCRIBE_COLUMNS = ['count', 'mean', 'std', 'min', '25%', '50%', '75%', 'max']
+GAP_COLUMNS = ['gap_start', 'gap_stop', 'gap_period']
+
+
+def inspect_all(ccd, spec, NHICcodes, byvar='site_id', by=False):
+    """Report rows for several fields from one pass over their long data
+
+    Gives the rows that DataRaw(NHICcode).inspect_row(by) would for each field
+    in turn, but the data for all fields are stacked, type converted (as the
+    spec Datatype) and summarised together, grouped by field (and byvar),
+    rather than a DataRaw being built and summarised for each field.
+    Numeric values are also checked against the spec Reference_ranges (for
+    all fields at once) and counted below, within and above the range. Date
+    and time fields are reported by inspect_datetimes.
+
+    Args:
+        ccd: CCD object
+        spec: data dictionary
+        NHICcodes (list): fields to report
+        byvar (str): infotb column to stratify by
+        by (bool): report each level of byvar separately
+
+    Returns:
+        DataFrame: rows for each field in the order of NHICcodes
+    """
+    fdtypes = _fdtypes(spec, NHICcodes)
+    codes = list(fdtypes)
+    if not codes:
+        return _in_order([inspect_datetimes(ccd, spec, NHICcodes, byvar, by)], NHICcodes)
+    print('*** Inspecting {} fields together'.format(len(codes)))
+
+    dfs = ccd.extract_many(codes, by=byvar)
+    long = _stack(dfs, ccd.episode_ids(), by)
+
+    # one group for each field (and level of byvar) in order of appearance
+    gid = long.groupby(['item', 'level'], sort=False, dropna=False).ngroup().values
+    first = np.unique(gid, return_index=True)[1]
+    groups = long.iloc[first][['item', 'level']].reset_index(drop=True)
+    groups['size'] = np.bincount(gid, minlength=len(groups))
+
+    groups = groups.join(_missingness(long, gid, groups, ccd.infotb, byvar, by))
+
+    item_fdtype = np.array([fdtypes[k] for k in codes])
+    is_float = item_fdtype[long['item'].values] == 'float'
+    num, status = to_numeric_unique(long.loc[is_float, 'value'].values)
+    coerced = np.bincount(gid[is_float][status == COERCED], minlength=len(groups))
+    cont = _describe(num, gid[is_float])
+    bounds = reference_ranges(spec)
+    validity = _validate(num, gid[is_float], long['item'].values[is_float], len(groups), codes, bounds)
+    counts, categories = _level_counts(long, gid, item_fdtype)
+
+    rows = []
+    for i, k in enumerate(codes):
+        d2d = spec[k]['NHICdtCode'] is not None
+        grp = groups[groups['item'] == i]
+        if not len(grp):
+            rows.append(_empty_row(k, byvar, fdtypes[k], len(ccd.infotb), k in bounds))
+            continue
+        for g, row_miss in grp.iterrows():
+            miss = OrderedDict([('miss_by_episode', row_miss['miss_by_episode'])])
+            if d2d:
+                miss.update((c, row_miss[c]) for c in GAP_COLUMNS)
+            if fdtypes[k] == 'float':
+                rows.append(_cont_row(k, byvar, row_miss['level'], coerced[g], cont.loc[g], miss,
+                                      validity[g] if k in bounds else None))
+            else:
+                rows.extend(_cat_rows(k, byvar, row_miss['level'], row_miss['size'], miss,
+                                      counts.get(g, pd.Series([], dtype=int)), categories.get(i)))
+
+    return _in_order([_to_frame(rows, byvar), inspect_datetimes(ccd, spec, NHICcodes, byvar, by)], NHICcodes)
+
+
+def inspect_store(ccd, spec, NHICcodes, byvar='site_id', by=False, memory=2**30):
+    """Report rows as inspect_all reading the fields from an h5 store in chunks
+
+    The item tables are each read once (CCD.iter_many), one chunk (sized from
+    the memory budget) at a time, and the rows of each field routed to its
+    own totals. Sizes, missingness, gaps and category counts are totalled for each
+    level of byvar as the chunks are read so are exact. Numeric values are
+    summarised with a mergeable ContSummary so quartiles are approximate for
+    large fields. The rows of an episode are assumed to be contiguous within a
+    field, as written by json2hdf. Date and time fields (about one value per
+    episode) are reported by inspect_datetimes.
+
+    Args:
+        ccd: CCD object for an h5 store opened with lazy=True
+        spec: data dictionary
+        NHICcodes (list): fields to report
+        byvar (str): infotb column to stratify by
+        by (bool): report each level of byvar separately
+        memory (int): rough bound in bytes for the memory used
+
+    Returns:
+        DataFrame: rows for each field in the order of NHICcodes
+    """
+    fdtypes = _fdtypes(spec, NHICcodes)
+    chunksize = _chunk_rows(ccd, memory)
+    print('*** Inspecting {} fields in chunks of {} rows'.format(len(fdtypes), chunksize))
+
+    ids = pd.Index(ccd.episode_ids())
+    t_admission = timedelta_to_ns(ccd.infotb['t_admission'].values)
+    t_discharge = timedelta_to_ns(ccd.infotb['t_discharge'].values)
+    if by:
+        n_episodes = ccd.infotb[byvar].value_counts(dropna=False).to_dict()
+    else:
+        n_episodes = {None: len(ccd.infotb)}
+
+    bounds = reference_ranges(spec)
+    accs = OrderedDict((k, _ItemAccumulator(fdtype, t_admission, t_discharge, bounds=bounds.get(k)))
+                       for k, fdtype in fdtypes.items())
+    for k, df in ccd.iter_many(list(fdtypes), chunksize, by=byvar):
+        accs[k].update(df, episode_positions(ids, df.index), by)
+    rows = []
+    for k, acc in accs.items():
+        acc.flush()
+        rows.extend(acc.rows(k, byvar, spec[k]['NHICdtCode'] is not None, n_episodes, len(ccd.infotb)))
+    return _in_order([_to_frame(rows, byvar), inspect_datetimes(ccd, spec, NHICcodes, byvar, by)], NHICcodes)
+
+
+def inspect_datetimes(ccd, spec, NHICcodes, byvar='site_id', by=False):
+    """Report rows for the date and time fields of NHICcodes
+
+    Each field is parsed as a DataRaw (DateTimeMixin) for its count, coerced
+    values, range and values flagged in the future or outside the stay, and
+    its missingness taken from the rows of infotb with a value. The fields
+    are extracted together (one scan of a JSON).
+
+    Args:
+        ccd: CCD object
+        spec: data dictionary
+        NHICcodes (list): fields to report (others are skipped)
+        byvar (str): infotb column to stratify by
+        by (bool): report each level of byvar separately
+
+    Returns:
+        DataFrame: rows for each date and time field in the order of NHICcodes
+    """
+    codes = [k for k in NHICcodes if DataRaw._datatype_to_pandas(spec[k]['Datatype']) == 'datetime64']
+    if not codes:
+        return pd.DataFrame()
+    print('*** Inspecting {} date and time fields'.format(len(codes)))
+    ids = pd.Index(ccd.episode_ids())
+    nep = len(ccd.infotb)
+    n_episodes = ccd.infotb[byvar].value_counts(dropna=False).to_dict() if by else {}
+    frames = []
+    for item in DataRaw.from_many(codes, ccd=ccd, spec=spec, byvar=byvar):
+        df = item.df
+        if by and len(df):
+            g, levels = pd.factorize(np.asarray(df['byvar'], dtype=object))
+        else:
+            g, levels = np.zeros(len(df), dtype=int), [None]
+        res = item._summary(df, g, levels).reset_index(drop=True)
+        pos = episode_positions(ids, df.index)
+        present = np.bincount(pd.unique(g.astype('i8') * nep + pos) // nep, minlength=len(levels))
+        n_ep = np.array([n_episodes.get(lv, nep) if lv is not None else nep for lv in levels], dtype=float)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            res['miss_by_episode'] = (n_ep - present) / n_ep
+        res.insert(0, byvar, list(levels))
+        res.insert(0, 'NHICcode', item.NHICcode)
+        frames.append(res)
+    return pd.concat(frames, ignore_index=True)
+
+
+def inspect_meta(ccd, spec, NHICcodes, byvar='site_id', by=False):
+    """Report rows for numeric fields stratified by the value of their meta item
+
+    Each field with an NHICmetaCode in the spec is joined to its meta item
+    and summarised for each meta value (and level of byvar), values without
+    a meta value making their own group. The fields and meta items are
+    extracted together and stacked, so all are joined (as
+    CCD.extract_with_meta) and summarised at once.
+
+    Args:
+        ccd: CCD object
+        spec: data dictionary
+        NHICcodes (list): fields to report (others are skipped)
+        byvar (str): infotb column to stratify by
+        by (bool): report each level of byvar separately
+
+    Returns:
+        DataFrame: rows (level 'meta') with a meta column, in the order of NHICcodes
+    """
+    codes = [k for k in NHICcodes if spec[k].get('NHICmetaCode') is not None
+             and DataRaw._datatype_to_pandas(spec[k]['Datatype']) == 'float']
+    print('*** Inspecting {} fields by their meta items'.format(len(codes)))
+    if not codes:
+        return _to_frame([], byvar)
+    meta_codes = [spec[k]['NHICmetaCode'] for k in codes]
+    dfs = ccd.extract_many(list(OrderedDict.fromkeys(codes + meta_codes)), by=byvar)
+    ids = ccd.episode_ids()
+    # the meta item of each field is stacked as that field (item) for the join
+    long = _stack(OrderedDict((k, dfs[k]) for k in codes), ids, by)
+    meta = _stack(OrderedDict((k, dfs[m]) for k, m in zip(codes, meta_codes)), ids, False)
+    row = sorted_join([long['item'].values, long['pos'].values, timedelta_to_ns(long['time'].values)],
+                      [meta['item'].values, meta['pos'].values, timedelta_to_ns(meta['time'].values)])
+    meta = np.r_[meta['value'].values, np.nan][row]
+
+    level = long['level'].values
+    keys = pd.DataFrame({'item': long['item'].values, 'level': level, 'meta': meta})
+    gid = keys.groupby(['item', 'level', 'meta'], sort=False, dropna=False).ngroup().values
+    first = np.unique(gid, return_index=True)[1]
+    num, status = to_numeric_unique(long['value'].values)
+    coerced = np.bincount(gid[status == COERCED], minlength=len(first))
+    stats = _describe(num, gid)
+    rows = []
+    for g, i in enumerate(first):
+        row = _cont_row(codes[long['item'].values[i]], byvar, level[i], coerced[g], stats.loc[g], {})
+        # marks the rows as by meta (including those without a meta value)
+        row['level'] = 'meta'
+        row['meta'] = meta[i]
+        rows.append(row)
+    return _to_frame(rows, byvar)
+
+
+class _ItemAccumulator:
+    """Totals for each level of byvar of one field, updated chunk by chunk"""
+
+    def __init__(self, fdtype, t_admission, t_discharge, delta=1000, bounds=None):
+        self.fdtype = fdtype
+        self.bounds = bounds
+        self.t_admission = t_admission
+        self.t_discharge = t_discharge
+        self.delta = delta
+        self.levels = OrderedDict()
+        # rows of the last episode of a chunk (it may continue in the next)
+        self.carry = None
+
+    def _totals(self, level):
+        if level not in self.levels:
+            self.levels[level] = {
+                'size': 0, 'present': 0, 'coerced': 0,
+                'gap_sum': np.zeros(3), 'gap_n': np.zeros(3),
+                # compressed beyond delta values so each summary stays small
+                'summary': ContSummary(self.delta, exact=self.delta) if self.fdtype == 'float' else None,
+                'counts': pd.Series([], dtype=float),
+                'validity': np.zeros(3, dtype=int)}
+        return self.levels[level]
+
+    def update(self, df, pos, by):
+        """Add a chunk of long data (pos is the row in infotb of each value)"""
+        if not len(df):
+            return
+        if 'time' in df.columns:
+            time = timedelta_to_ns(df['time'].values)
+        else:
+            time = np.full(len(df), np.nan)
+        level = np.asarray(df['byvar'], dtype=object) if by else np.full(len(df), None, dtype=object)
+        block = [np.asarray(df['value'], dtype=object), time, level, pos]
+        if self.carry is not None:
+            block = [np.concatenate([c, b]) for c, b in zip(self.carry, block)]
+        # hold back the last episode
+        pos = block[3]
+        change = np.flatnonzero(pos[1:] != pos[:-1])
+        cut = change[-1] + 1 if len(change) else 0
+        self.carry = [b[cut:] for b in block]
+        if cut:
+            self._add([b[:cut] for b in block])
+
+    def flush(self):
+        """Add the rows held back from the last chunk"""
+        if self.carry is not None:
+            self._add(self.carry)
+        self.carry = None
+
+    def _add(self, block):
+        """Add rows holding only whole episodes"""
+        value, time, level, pos = block
+        new = np.r_[True, pos[1:] != pos[:-1]]
+        seg = np.cumsum(new) - 1
+        starts = np.flatnonzero(new)
+        tmin, tmax, gap = segment_times(time, seg, len(starts))
+        gaps = np.c_[tmin - self.t_admission[pos[starts]],
+                     tmax - self.t_discharge[pos[starts]], gap]
+        for lv in pd.unique(level):
+            tot = self._totals(lv)
+            mask = pd.isnull(level) if lv is None else level == lv
+            seg_mask = mask[starts]
+            tot['size'] += mask.sum()
+            tot['present'] += seg_mask.sum()
+            ok = ~np.isnan(gaps[seg_mask])
+            tot['gap_sum'] += np.where(ok, gaps[seg_mask], 0).sum(axis=0)
+            tot['gap_n'] += ok.sum(axis=0)
+            if self.fdtype == 'float':
+                num, status = to_numeric_unique(value[mask])
+                tot['coerced'] += (status == COERCED).sum()
+                tot['summary'].update(num)
+                if self.bounds is not None:
+                    tot['validity'] += range_counts(num, np.zeros(len(num), dtype=int), 1, *self.bounds)[0]
+            else:
+                tot['counts'] = tot['counts'].add(pd.Series(value[mask]).value_counts(), fill_value=0)
+
+    def rows(self, NHICcode, byvar, d2d, n_episodes, nep):
+        """Report rows for the field from the totals"""
+        if not self.levels:
+            return [_empty_row(NHICcode, byvar, self.fdtype, nep, self.bounds is not None)]
+        categories = None
+        if self.fdtype == 'category':
+            values = pd.unique(np.concatenate([np.asarray(t['counts'].index, dtype=object)
+                                               for t in self.levels.values()]))
+            categories = pd.Categorical(values).categories
+        rows = []
+        for lv, tot in self.levels.items():
+            n_ep = float(n_episodes.get(lv, nep) if lv is not None else nep)
+            miss = OrderedDict([('miss_by_episode', (n_ep - tot['present']) / n_ep)])
+            if d2d:
+                with np.errstate(invalid='ignore', divide='ignore'):
+                    means = np.where(tot['gap_n'] > 0, tot['gap_sum'] / tot['gap_n'], np.nan)
+                miss.update(zip(GAP_COLUMNS, means))
+            if self.fdtype == 'float':
+                rows.append(_cont_row(NHICcode, byvar, lv, tot['coerced'], tot['summary'].describe(), miss,
+                                      tot['validity'] if self.bounds is not None else None))
+            else:
+                rows.extend(_cat_rows(NHICcode, byvar, lv, tot['size'], miss, tot['counts'], categories))
+        return rows
+
+
+def _fdtypes(spec, NHICcodes):
+    """Type (as DataRaw) of each field, leaving out date and time fields
+    (see inspect_datetimes)"""
+    fdtypes = OrderedDict((k, DataRaw._datatype_to_pandas(spec[k]['Datatype'])) for k in NHICcodes)
+    return OrderedDict((k, v) for k, v in fdtypes.items() if v != 'datetime64')
+
+
+def _in_order(frames, NHICcodes):
+    """Report rows of several frames as one, with the fields in the order of
+    NHICcodes (and the rows of a field in their order)"""
+    frames = [f for f in frames if len(f)]
+    if not frames:
+        return pd.DataFrame()
+    res = pd.concat(frames, ignore_index=True)
+    order = {k: i for i, k in enumerate(NHICcodes)}
+    return res.iloc[np.argsort(res['NHICcode'].map(order).values, kind='mergesort')].reset_index(drop=True)
+
+
+def _chunk_rows(ccd, memory):
+    """Rows of long data to read at once within a memory budget (bytes)"""
+    sample = ccd.store.select('item_2d', start=0, stop=1000)
+    row_bytes = sample.memory_usage(deep=True).sum() / max(len(sample), 1)
+    memory = memory - ccd.infotb.memory_usage(deep=True).sum()
+    if memory <= 0:
+        warnings.warn('\n!!! Memory budget is less than infotb alone')
+    # formatted and converted copies of a chunk are held at once
+    return max(1000, int(memory / (row_bytes * 8)))
+
+
+def _to_frame(rows, byvar):
+    """Report rows (dicts) as a dataframe with numeric and timedelta columns"""
+    res = pd.DataFrame(rows, dtype=object)
+    for col in res.columns:
+        if col in GAP_COLUMNS:
+            res[col] = timedelta_from_ns(res[col].astype(float).values)
+        elif col not in ['NHICcode', byvar, 'level', 'meta', 'coerced', 'coerced_values']:
+            res[col] = res[col].astype(float)
+    return res
+
+
+def _stack(dfs, ids, by):
+    """Stack the data for each field in one long frame
+    with the field (item), byvar level and row of infotb (pos) of each value"""
+    ids = pd.Index(ids)
+    parts = []
+    for i, df in enumerate(dfs.values()):
+        n = len(df)
+        if 'time' in df.columns:
+            time = df['time'].values.astype('m8[ns]')
+        else:
+            time = np.full(n, np.timedelta64('NaT'), dtype='m8[ns]')
+        parts.append(pd.DataFrame({
+            'item': np.full(n, i),
+            'value': np.asarray(df['value'], dtype=object),
+            'time': time,
+            'level': np.asarray(df['byvar'], dtype=object) if by else np.full(n, None, dtype=object),
+            'pos': episode_positions(ids, df.index)},
+            columns=['item', 'value', 'time', 'level', 'pos']))
+    return pd.concat(parts, ignore_index=True)
+
+
+def _group_mean(v, g, ngroups):
+    """Mean of v (skipping NaN) for each of ngroups groups g"""
+    ok = ~np.isnan(v)
+    total = np.bincount(g[ok], weights=v[ok], minlength=ngroups)
+    n = np.bincount(g[ok], minlength=ngroups)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(n > 0, total / n, np.nan)
+
+
+def _missingness(long, gid, groups, infotb, byvar, by):
+    """Mean missingness and gaps over the episodes of infotb for each group
+    as make_misstb then mean for each field and byvar level"""
+    nep = len(infotb)
+    ngroups = len(groups)
+    if by:
+        n_episodes = groups['level'].map(infotb[byvar].value_counts(dropna=False)).values
+    else:
+        n_episodes = np.full(ngroups, nep)
+
+    # one segment for each episode with data for a group
+    seg, uniq = pd.factorize(gid.astype('i8') * nep + long['pos'].values)
+    seg_gid, seg_pos = uniq // nep, uniq % nep
+    present = np.bincount(seg_gid, minlength=ngroups)
+
+    tmin, tmax, gap = segment_times(timedelta_to_ns(long['time'].values), seg, len(uniq))
+    t_admission = timedelta_to_ns(infotb['t_admission'].values)
+    t_discharge = timedelta_to_ns(infotb['t_discharge'].values)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        res = pd.DataFrame({
+            'miss_by_episode': (n_episodes - present) / n_episodes.astype(float),
+            'gap_start': _group_mean(tmin - t_admission[seg_pos], seg_gid, ngroups),
+            'gap_stop': _group_mean(tmax - t_discharge[seg_pos], seg_gid, ngroups),
+            'gap_period': _group_mean(gap, seg_gid, ngroups)},
+            columns=['miss_by_episode'] + GAP_COLUMNS)
+    return res
+
+
+def _describe(num, gid):
+    """describe() of numeric values for each group"""
+    grouped = pd.Series(num).groupby(gid)
+    res = grouped.agg(['count', 'mean', 'std', 'min', 'max'])
+    quantiles = grouped.quantile([.25, .5, .75]).unstack().reindex(columns=[.25, .5, .75])
+    quantiles.columns = ['25%', '50%', '75%']
+    return res.join(quantiles)[DESCRIBE_COLUMNS]
+
+
+def _level_counts(long, gid, item_fdtype):
+    """Counts of each value for each group of non numeric fields, and the
+    categories of each field (as pd.Categorical) of the category datatype"""
+    fdtype = item_fdtype[long['item'].values]
+    is_cat = fdtype != 'float'
+    vals = long.loc[is_cat, 'value']
+    counts = vals.groupby([gid[is_cat], vals.values]).size()
+    counts = {g: c.droplevel(0) for g, c in counts.groupby(level=0)}
+    is_cat = fdtype == 'category'
+    categories = {}
+    for i, v in long.loc[is_cat, 'value'].groupby(long.loc[is_cat, 'item'].values):
+        categories[i] = pd.Categorical(pd.unique(v.values)).categories
+    return counts, categories
+
+
+def _validate(num, gid, item, ngroups, codes, bounds):
+    """Counts below, within and above the reference range of each group
+    from one pass over the numeric values of all fields (rows of zeros for
+    fields without a range)"""
+    low = np.array([bounds.get(k, (np.nan, np.nan))[0] for k in codes])
+    high = np.array([bounds.get(k, (np.nan, np.nan))[1] for k in codes])
+    has = ~np.isnan(low[item])
+    return range_counts(num[has], gid[has], ngroups, low[item[has]], high[item[has]])
+
+
+def _cont_row(NHICcode, byvar, level, coerced, stats, miss, validity=None):
+    """Row for a numeric field as ContMixin.inspect_row
+    with counts against the reference range (validity) if it has one"""
+    row = OrderedDict([('NHICcode', NHICcode), (byvar, level), ('coerced_values', coerced)])
+    row.update(stats)
+    if validity is not None:
+        row.update(zip(RANGE_COLUMNS, validity))
+    row.update(miss)
+    return row
+
+
+def _cat_rows(NHICcode, byvar, level, size, miss, n_levels, categories):
+    """Header and level rows for a categorical field as CatMixin._rows
+    from the counts of each value (n_levels) within the level of byvar"""
+    row_keys = ['NHICcode', byvar, 'level', 'count', 'n', 'pct', 'nunique'] + ['miss_by_episode'] + GAP_COLUMNS
+
+    row = OrderedDict.fromkeys(row_keys)
+    row['NHICcode'] = NHICcode
+    row[byvar] = level
+    row['level'] = 'header'
+    row['nunique'] = len(n_levels)
+    row['count'] = size
+    row['coerced'] = None # b/c categorical and no type conversion attempted
+    row.update(miss)
+    rows = [row]
+
+    if categories is None:
+        warnings.warn('\n!!! Unable to parse categories of {} holding {} values'.format(NHICcode, size))
+        return rows
+    for lvl in categories:
+        row = OrderedDict.fromkeys(row_keys)
+        row['NHICcode'] = NHICcode
+        row[byvar] = level
+        row['level'] = lvl
+        row['n'] = n_levels.get(lvl, 0)
+        row['pct'] = row['n'] / size
+        rows.append(row)
+    return rows
+
+
+def _empty_row(NHICcode, byvar, fdtype, nep, ranged=False):
+    """Row for a field without any data"""
+    row = OrderedDict([('NHICcode', NHICcode), (byvar, None)])
+    if fdtype == 'float':
+        row['coerced_values'] = 0
+        row['count'] = 0
+        if ranged:
+            row.update((c, 0) for c in RANGE_COLUMNS)
+    else:
+        row['level'] = 'header'
+        row['count'] = 0
+        row['nunique'] = 0
+        row['coerced'] = None
+        warnings.warn('\n!!! Unable to parse categories of {} holding {} values'.format(NHICcode, 0))
+    row['miss_by_episode'] = 1.0 if nep else np.nan
+    return row
@@ -0,0 +1,165 @@
+import numpy as np
+import pandas as pd
+
+
+# values held exactly (not compressed) by a ContSummary by default
+EXACT_SIZE = 10000
+
+
+class TDigest:
+    """ Mergeable approximate quantiles (merging t-digest)
+
+    Values are held as centroids (mean and weight). Until more than exact
+    values are added they are all kept, so quantiles are exact. After that,
+    compression merges neighbouring centroids (in order) while the span of
+    the merged centroid on the k1 scale function, k(q) = delta / (2 pi) *
+    arcsin(2q - 1), is at most 1, so centroids are small in the tails and
+    larger in the middle. Chunks (or sites) can be digested separately and
+    merged.
+
+    Args:
+        delta (float): Compression; at most about delta centroids are kept
+            and larger values are more accurate
+        exact (int): Values to keep before compressing (at least delta)
+    """
+
+    def __init__(self, delta=100, exact=None):
+        self.delta = delta
+        self.exact = max(exact or 0, delta)
+        self.means = np.array([])
+        self.weights = np.array([])
+
+    def __len__(self):
+        return int(self.weights.sum())
+
+    def update(self, values):
+        """Add an array of values (NaN are ignored)"""
+        values = np.asarray(values, dtype=float)
+        values = values[~np.isnan(values)]
+        self._compress(np.r_[self.means, values], np.r_[self.weights, np.ones(len(values))])
+        return self
+
+    def merge(self, other):
+        """Add the centroids of another digest"""
+        self._compress(np.r_[self.means, other.means], np.r_[self.weights, other.weights])
+        return self
+
+    def _scale(self, q):
+        """k1 scale function (from -delta / 4 to delta / 4)"""
+        return self.delta / (2 * np.pi) * np.arcsin(2 * np.clip(q, 0, 1) - 1)
+
+    def _scale_inverse(self, k):
+        k = np.clip(k, -self.delta / 4, self.delta / 4)
+        return (np.sin(2 * np.pi * k / self.delta) + 1) / 2
+
+    def _compress(self, means, weights):
+        order = np.argsort(means, kind='mergesort')
+        means, weights = means[order], weights[order]
+        if len(means) <= self.delta or weights.sum() <= self.exact:
+            # small enough to keep as is (so exact while only values are held)
+            self.means, self.weights = means, weights
+            return
+        cum = np.cumsum(weights)
+        n = cum[-1]
+        # each merged centroid runs from the first centroid not yet merged to
+        # the last whose end is within one unit of k of its start (a centroid
+        # heavier than that stands alone); one search per merged centroid
+        starts, i = [], 0
+        while i < len(cum):
+            q0 = cum[i - 1] / n if i else 0.
+            limit = n * self._scale_inverse(self._scale(q0) + 1)
+            j = max(int(np.searchsorted(cum, limit, side='right')) - 1, i)
+            starts.append(i)
+            i = j + 1
+        w = np.add.reduceat(weights, starts)
+        self.means = np.add.reduceat(means * weights, starts) / w
+        self.weights = w
+
+    def quantile(self, q, vmin=None, vmax=None):
+        """Approximate quantile(s) q (linear interpolation as np.percentile)
+        Exact while every centroid holds a single value"""
+        n = self.weights.sum()
+        if n == 0:
+            return np.full(np.shape(q), np.nan) if np.ndim(q) else np.nan
+        # (zero based) rank of the middle of each centroid
+        pos = np.cumsum(self.weights) - self.weights / 2 - 0.5
+        xp, fp = pos, self.means
+        if vmin is not None:
+            xp, fp = np.r_[0, xp], np.r_[vmin, fp]
+        if vmax is not None:
+            xp, fp = np.r_[xp, n - 1], np.r_[fp, vmax]
+        return np.interp(np.asarray(q) * (n - 1), xp, fp)
+
+
+class ContSummary:
+    """ Mergeable summary of numeric values
+
+    Count, mean and variance are combined exactly (Welford, with Chan's
+    update to merge summaries), as are min and max. Quantiles are from a
+    TDigest, so exact up to exact values and approximate beyond. Summaries
+    built for each chunk, partition or site can be merged without returning
+    to the data.
+
+    Args:
+        delta (float): Compression of the TDigest
+        exact (int): Values up to which quantiles are exact (see TDigest)
+    """
+
+    def __init__(self, delta=100, exact=EXACT_SIZE):
+        self.n = 0
+        self.mean = 0.
+        self.m2 = 0.
+        self.min = np.nan
+        self.max = np.nan
+        self.digest = TDigest(delta, exact)
+
+    @classmethod
+    def from_values(cls, values, delta=100, exact=EXACT_SIZE):
+        return cls(delta, exact).update(values)
+
+    def update(self, values):
+        """Add an array of values (NaN are ignored)"""
+        values = np.asarray(values, dtype=float)
+        values = values[~np.isnan(values)]
+        if not len(values):
+            return self
+        other = ContSummary(self.digest.delta, self.digest.exact)
+        other.n = len(values)
+        other.mean = values.mean()
+        other.m2 = ((values - other.mean) ** 2).sum()
+        other.min, other.max = values.min(), values.max()
+        other.digest.update(values)
+        return self.merge(other)
+
+    def merge(self, other):
+        """Combine with the summary of other values"""
+        if other.n == 0:
+            return self
+        n = self.n + other.n
+        d = other.mean - self.mean
+        self.mean = self.mean + d * other.n / n
+        self.m2 = self.m2 + other.m2 + d * d * self.n * other.n / n
+        self.n = n
+        self.min = np.fmin(self.min, other.min)
+        self.max = np.fmax(self.max, other.max)
+        self.digest.merge(other.digest)
+        return self
+
+    @property
+    def var(self):
+        """Sample variance (ddof=1 as pandas)"""
+        return self.m2 / (self.n - 1) if self.n > 1 else np.nan
+
+    @property
+    def std(self):
+        return np.sqrt(self.var)
+
+    def quantile(self, q):
+        return self.digest.quantile(q, vmin=self.min, vmax=self.max)
+
+    def describe(self):
+        """Series as pd.Series.describe (with approximate quartiles)"""
+        q = self.quantile([.25, .5, .75]) if self.n else [np.nan] * 3
+        return pd.Series([float(self.n), self.mean if self.n else np.nan, self.std,
+                          self.min, q[0], q[1], q[2], self.max],
+                         index=['count', 'mean', 'std', 'min', '25%', '50%', '75%', 'max'])
@@ -0,0 +1,193 @@
+import json
+import argparse
+import numpy as np
+import pandas as pd
+
+from inspectEHR.utils import load_spec, reference_ranges, DATETIME_FORMATS
+
+
+# levels given to list (and meta) fields, which the spec does not enumerate
+LIST_LEVELS = ['1', '2', '3', '4', '5']
+LOGICAL_LEVELS = ['YES', 'NO']
+# values that will not convert to the field's type
+JUNK = ['x', ' ', 'NA', '?']
+
+
+class SyntheticCCD:
+    """ Synthetic CCD episodes (as read from a CCD JSON) driven by the spec
+
+    Each episode holds a random subset of the spec's fields. 1d fields hold a
+    single string and 2d fields (dateandtime) a series of values at times
+    (hours from admission) drawn at about density per hour of the stay. Values
+    follow the Datatype: numeric fields fall around their Reference_ranges
+    (so some are out of range) or up to their Template, list fields take one
+    of a few levels and date/time fields are written in their Template format
+    within the stay. 2d fields with an NHICmetaCode are given meta items at
+    some of their times. A fraction junk of values do not convert.
+
+    Args:
+        spec: data specification as dictionary
+        n_episodes (int): Episodes to make
+        sites (list): Site IDs (episodes are spread evenly over these)
+        items_per_episode (int): Fields held by each episode (None for all)
+        density (float): Mean 2d values per hour of stay
+        junk (float): Fraction of values that will not convert
+        seed (int): Seed for the random generator
+
+    Example:
+        SyntheticCCD(spec, n_episodes=1000).to_json('synthetic.JSON')
+        ccd = CCD('synthetic.JSON', spec)
+    """
+
+    def __init__(self, spec, n_episodes=100, sites=list('ABCDE'), items_per_episode=None,
+                 density=1., junk=0.01, seed=0):
+        self.spec = spec
+        self.n_episodes = n_episodes
+        self.sites = list(sites)
+        self.items_per_episode = items_per_episode
+        self.density = density
+        self.junk = junk
+        self.seed = seed
+        self.fields = list(spec.keys())
+        self.bounds = reference_ranges(spec)
+
+    def __len__(self):
+        return self.n_episodes
+
+    def __iter__(self):
+        rng = np.random.default_rng(self.seed)
+        # admissions from 2014 to 2017 with log normal stays (median 3 days)
+        t0 = pd.Timestamp('2014-01-01').timestamp()
+        admissions = np.sort(rng.uniform(t0, t0 + 4 * 365 * 86400, self.n_episodes))
+        stays = np.clip(rng.lognormal(np.log(72), 0.8, self.n_episodes), 2, 24 * 90)
+        counts = {}
+        for i in range(self.n_episodes):
+            site = self.sites[i % len(self.sites)]
+            counts[site] = counts.get(site, -1) + 1
+            t_admission = float(np.floor(admissions[i]))
+            yield {
+                'site_id': site,
+                'episode_id': str(counts[site]),
+                'nhs_number': int(i),
+                'pas_number': str(i),
+                't_admission': t_admission,
+                't_discharge': t_admission + float(np.floor(stays[i] * 3600)),
+                'parse_file': 'synthetic_{}.xml'.format(site),
+                # seconds taken to parse the episode's file
+                'parse_time': float(np.round(rng.uniform(0.1, 5), 3)),
+                'data': self._episode_data(rng, i, t_admission, stays[i]),
+            }
+
+    def _episode_data(self, rng, i, t_admission, stay):
+        """data of an episode (pid, spell and its fields)"""
+        data = {'pid': int(i), 'spell': 0}
+        fields = self.fields
+        if self.items_per_episode is not None and self.items_per_episode < len(fields):
+            fields = [fields[j] for j in np.sort(rng.choice(len(fields), self.items_per_episode, replace=False))]
+        for k in fields:
+            fspec = self.spec[k]
+            if not fspec['dateandtime']:
+                data[k] = self._values(rng, k, 1, t_admission, stay)[0]
+                continue
+            n = max(rng.poisson(self.density * stay), 1)
+            time = np.sort(rng.uniform(0, stay, n))
+            data[k] = {'item2d': self._values(rng, k, n, t_admission, stay),
+                       'time': time.tolist()}
+            meta = fspec.get('NHICmetaCode')
+            if meta:
+                keep = np.sort(rng.choice(n, max(n // 2, 1), replace=False))
+                data[meta] = {'item2d': rng.choice(LIST_LEVELS, len(keep)).tolist(),
+                              'time': time[keep].tolist()}
+        return data
+
+    def _values(self, rng, NHICcode, n, t_admission, stay):
+        """n values (strings) for NHICcode"""
+        fspec = self.spec[NHICcode]
+        datatype = fspec['Datatype'].lower()
+        if datatype == 'numeric':
+            if NHICcode in self.bounds:
+                low, high = self.bounds[NHICcode]
+                vals = rng.normal((low + high) / 2, (high - low) / 2, n)
+            else:
+                template = fspec.get('Template')
+                high = min(template, 1000) if isinstance(template, (int, float)) else 100
+                vals = rng.uniform(0, high, n)
+            vals = np.round(vals, 1).astype(str).tolist()
+        elif datatype in ['date', 'time', 'date/time']:
+            fmt = DATETIME_FORMATS.get(fspec.get('Template'), DATETIME_FORMATS[datatype])
+            seconds = t_admission + rng.uniform(0, stay * 3600, n)
+            vals = pd.to_datetime(seconds, unit='s').strftime(fmt).tolist()
+        elif datatype == 'logical':
+            vals = rng.choice(['1', '0'], n).tolist()
+        elif datatype == 'list / logical':
+            vals = rng.choice(LOGICAL_LEVELS, n).tolist()
+        elif datatype == 'list':
+            vals = rng.choice(LIST_LEVELS, n).tolist()
+        else:
+            vals = ['{}_{}'.format(NHICcode[-4:], j) for j in rng.integers(0, 20, n)]
+        if self.junk:
+            bad = np.flatnonzero(rng.random(n) < self.junk)
+            for j in bad:
+                vals[j] = JUNK[rng.integers(len(JUNK))]
+        return vals
+
+    def to_json(self, path):
+        """Write the episodes to path as a JSON array (one episode at a time)"""
+        with open(path, 'w') as f:
+            f.write('[')
+            for i, episode in enumerate(self):
+                if i:
+                    f.write(',\n')
+                # dumps (unlike dump) uses the C encoder
+                f.write(json.dumps(episode))
+            f.write(']\n')
+        return path
+
+
+def main(args):
+    spec = load_spec(args.spec)
+    SyntheticCCD(spec, n_episodes=args.episodes, sites=args.sites,
+                 items_per_episode=args.items, density=args.density,
+                 junk=args.junk, seed=args.seed).to_json(args.path)
+    print('*** Wrote {} synthetic episodes to {}'.format(args.episodes, args.path))
+
+
+def cli():
+    ''' Command line interface for running script '''
+    parser = argparse.ArgumentParser(
+        description='Write a synthetic CCD JSON object from the data specification'
+    )
+    parser.add_argument('path',
+                        help='JSON file to write')
+    parser.add_argument('-s', '--spec',
+                        default='N_DataItems.yml',
+                        help='Data specification')
+    parser.add_argument('-n', '--episodes',
+                        type=int,
+                        default=100,
+                        help='Episodes to write')
+    parser.add_argument('--sites',
+                        nargs='+',
+                        default=list('ABCDE'),
+                        help='Site IDs')
+    parser.add_argument('-i', '--items',
+                        type=int,
+                        default=None,
+                        help='Fields held by each episode (default all)')
+    parser.add_argument('-d', '--density',
+                        type=float,
+                        default=1.,
+                        help='Mean 2d values per hour of stay')
+    parser.add_argument('--junk',
+                        type=float,
+                        default=0.01,
+                        help='Fraction of values that will not convert')
+    parser.add_argument('--seed',
+                        type=int,
+                        default=0,
+                        help='Seed for the random generator')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    main(cli())
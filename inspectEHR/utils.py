@@ -1,3 +1,9 @@
+import re
+import json
+from functools import lru_cache
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
 import yaml
 
 
@@ -5,3 +11,304 @@ def load_spec(filepath):
     """Loads in CC-HIC specification from YAML."""
     with open(filepath, 'r') as f:
         return yaml.load(f)
+
+
+# whitespace and commas between the elements of a JSON array
+_JSON_SEPARATORS = re.compile(r'[\s,]*')
+_JSON_ENDS = frozenset(' \t\n\r,]')
+
+
+def iter_json_array(filepath, blocksize=2**20):
+    """Yield the elements of a top level JSON array one at a time.
+
+    Reads the file in blocks so that only the current element (plus one block)
+    is held in memory, rather than the whole array as json.load would.
+
+    Args:
+        filepath (str): Path to file containing a JSON array (e.g. CCD export)
+        blocksize (int): Number of characters to read from disk at a time
+    """
+    decoder = json.JSONDecoder()
+    with open(filepath, 'r') as f:
+        buf = f.read(blocksize).lstrip()
+        while not buf:
+            chunk = f.read(blocksize)
+            if not chunk:
+                break
+            buf = chunk.lstrip()
+        if not buf.startswith('['):
+            raise ValueError('!!! Expects a JSON array in {}'.format(filepath))
+        # position in buf; the buffer is only compacted when a block is read
+        pos = 1
+        eof = False
+        while True:
+            # skip separators between elements
+            pos = _JSON_SEPARATORS.match(buf, pos).end()
+            if pos == len(buf) and not eof:
+                chunk = f.read(blocksize)
+                eof = not chunk
+                buf = buf[pos:] + chunk
+                pos = 0
+                continue
+            if buf.startswith(']', pos):
+                return
+            try:
+                obj, idx = decoder.raw_decode(buf, pos)
+                # a number cut by the block boundary still decodes, so an
+                # element only counts once a separator or ']' follows it
+                if not eof and (idx == len(buf) or buf[idx] not in _JSON_ENDS):
+                    raise json.JSONDecodeError('Element may continue', buf, idx)
+            except json.JSONDecodeError:
+                # element spans the block boundary so read more and retry
+                if eof:
+                    raise ValueError('!!! Truncated or malformed JSON in {}'.format(filepath))
+                chunk = f.read(max(blocksize, len(buf) - pos))
+                eof = not chunk
+                buf = buf[pos:] + chunk
+                pos = 0
+                continue
+            pos = idx
+            yield obj
+
+
+def segment_median(values, offsets):
+    """Median of each segment of values delimited by offsets (CSR style)
+
+    Sorts within segments once and picks the middle element(s) of each, so no
+    Python level loop over segments is needed.
+
+    Args:
+        values (np.ndarray): 1d numeric values, segments stored contiguously
+        offsets (np.ndarray): segment i is values[offsets[i]:offsets[i+1]]
+    Returns:
+        np.ndarray: float medians, NaN for empty segments or NaN only segments
+    """
+    values = np.asarray(values, dtype=float)
+    offsets = np.asarray(offsets)
+    lengths = np.diff(offsets)
+    seg = np.repeat(np.arange(len(lengths)), lengths)
+    counts = np.bincount(seg, weights=~np.isnan(values), minlength=len(lengths)).astype(int)
+    # NaN sort last within each segment so the first counts values are valid
+    values = values[np.lexsort((values, seg))]
+    res = np.full(len(lengths), np.nan)
+    ok = counts > 0
+    lo = offsets[:-1][ok] + (counts[ok] - 1) // 2
+    hi = offsets[:-1][ok] + counts[ok] // 2
+    res[ok] = (values[lo] + values[hi]) / 2
+    return res
+
+
+def timedelta_to_ns(t):
+    """Timedeltas as float nanoseconds with NaN for NaT"""
+    t = np.asarray(t).astype('timedelta64[ns]')
+    return np.where(np.isnat(t), np.nan, t.view('i8').astype(float))
+
+
+def timedelta_from_ns(v):
+    """Float nanoseconds (NaN for missing) as timedelta64[ns] with NaT"""
+    v = np.asarray(v, dtype=float)
+    res = np.full(len(v), np.timedelta64('NaT'), dtype='m8[ns]')
+    ok = ~np.isnan(v)
+    res[ok] = np.round(v[ok]).astype('i8').view('m8[ns]')
+    return res
+
+
+def segment_times(t, g, ngroups):
+    """First and last time and median gap between times within each group
+
+    Sorts once by group and time and reduces each group as a segment.
+
+    Args:
+        t (np.ndarray): times as float ns (NaN if missing)
+        g (np.ndarray): group (0 to ngroups - 1) of each time
+        ngroups (int): number of groups, each of which must hold a time
+    Returns:
+        tuple: float ns arrays (tmin, tmax, gap) with one value per group
+    """
+    if not len(t):
+        return np.array([]), np.array([]), np.array([])
+    order = np.lexsort((t, g))
+    t = t[order]
+    offsets = np.r_[0, np.cumsum(np.bincount(g, minlength=ngroups))]
+    starts, stops = offsets[:-1], offsets[1:]
+    # drop the difference that spans each boundary between groups
+    gaps = np.diff(t)
+    keep = np.ones(len(gaps), dtype=bool)
+    keep[stops[:-1] - 1] = False
+    gap_offsets = offsets - np.arange(len(offsets))
+    return (np.fmin.reduceat(t, starts), np.fmax.reduceat(t, starts),
+            segment_median(gaps[keep], gap_offsets))
+
+
+RANGE_COLUMNS = ['below', 'within', 'above']
+
+
+@lru_cache(maxsize=None)
+def parse_reference_range(s):
+    """Numeric bounds of a spec Reference_ranges string such as '135 - 145'
+    (anything after the bounds e.g. '(operating range)' is ignored)
+
+    Returns:
+        tuple: (low, high) floats or None if s is not a range
+    """
+    if not isinstance(s, str):
+        return None
+    m = re.match(r'\s*(-?\d+(?:\.\d*)?)\s*-\s*(-?\d+(?:\.\d*)?)', s)
+    if m is None:
+        return None
+    return float(m.group(1)), float(m.group(2))
+
+
+def reference_ranges(spec):
+    """Bounds (low, high) for each field of spec with a reference range"""
+    res = OrderedDict()
+    for k, v in spec.items():
+        bounds = parse_reference_range(v.get('Reference_ranges'))
+        if bounds is not None:
+            res[k] = bounds
+    return res
+
+
+def range_counts(values, g, ngroups, low, high):
+    """Count values below, within (inclusive) and above their bounds by group
+
+    Args:
+        values (np.ndarray): float values (NaN are not counted)
+        g (np.ndarray): group (0 to ngroups - 1) of each value
+        ngroups (int): number of groups
+        low, high: bounds, either scalars or arrays matching values
+    Returns:
+        np.ndarray: (ngroups, 3) counts with columns as RANGE_COLUMNS
+    """
+    values = np.asarray(values, dtype=float)
+    ok = ~np.isnan(values)
+    # 0 below, 1 within and 2 above
+    cls = np.where(values < low, 0, np.where(values > high, 2, 1))
+    return np.bincount(np.asarray(g)[ok] * 3 + cls[ok], minlength=ngroups * 3).reshape(ngroups, 3)
+
+
+# strftime formats for the spec Template (or else Datatype) of date/time fields
+DATETIME_FORMATS = {
+    'yyyy-mm-dd': '%Y-%m-%d',
+    'yyyy-mm-dd hh:mm': '%Y-%m-%d %H:%M',
+    'hh:mm': '%H:%M',
+    'date': '%Y-%m-%d',
+    'date/time': '%Y-%m-%d %H:%M',
+    'time': '%H:%M'}
+
+
+# status of each raw value after conversion (convert_unique)
+VALID, BLANK, COERCED = 0, 1, 2
+
+
+def convert_unique(vals, convert, keep_coerced=False):
+    """Convert each distinct raw value once and broadcast the results back
+
+    Clinical values repeat heavily so the raw values are factorized, the
+    distinct values converted and classified, and the results taken back out
+    by the factor codes, which cuts the work by the duplication factor.
+
+    Args:
+        vals: raw values
+        convert: function of an object array of distinct raw values giving an
+            array of converted values (NaN or NaT where they can not be)
+        keep_coerced (bool): also return the raw values that were coerced
+    Returns:
+        tuple: (converted values, int8 status of each value as VALID, BLANK
+            for missing or whitespace only, or COERCED if it did not convert)
+            and if keep_coerced a pd.Categorical of the raw value of those
+            coerced (NaN for the others)
+    """
+    codes, uniques = pd.factorize(np.asarray(vals, dtype=object))
+    converted = np.asarray(convert(uniques))
+    blank = np.array([isinstance(u, str) and not u.strip() for u in uniques], dtype=bool)
+    status = np.where(blank, BLANK, np.where(pd.isnull(converted), COERCED, VALID)).astype('int8')
+    if converted.dtype.kind in 'mM':
+        missing = np.array(['NaT'], dtype=converted.dtype)
+    else:
+        converted, missing = converted.astype(float), [np.nan]
+    converted[blank] = missing[0]
+    # code -1 (missing) picks the value on the end
+    res = np.r_[converted, missing][codes], np.r_[status, BLANK][codes].astype('int8')
+    if keep_coerced:
+        is_coerced = status == COERCED
+        remap = np.full(len(uniques) + 1, -1)
+        remap[np.flatnonzero(is_coerced)] = np.arange(is_coerced.sum())
+        res += (pd.Categorical.from_codes(remap[codes], categories=uniques[is_coerced]),)
+    return res
+
+
+def to_numeric_unique(vals, keep_coerced=False):
+    """Float values as pd.to_numeric(errors='coerce') converting each distinct
+    value once (see convert_unique)"""
+    return convert_unique(vals, lambda u: pd.to_numeric(pd.Series(u, dtype=object), errors='coerce').values,
+                          keep_coerced)
+
+
+def parse_datetimes(vals, fmt, keep_coerced=False):
+    """Parse date/time strings with an explicit format
+
+    Each distinct string is parsed once and the result mapped back to the
+    values (see convert_unique), so there is no per value format inference. A
+    format without a date (e.g. '%H:%M') gives the time of day as a timedelta.
+
+    Args:
+        vals: strings to parse
+        fmt (str): strftime format of the strings
+    Returns:
+        tuple: datetime64[ns] (or timedelta64[ns]) values with NaT where a
+            value is missing or does not match fmt, and the status of each
+    """
+    def parse(uniques):
+        parsed = pd.to_datetime(pd.Index(uniques, dtype=object).astype(str), format=fmt, errors='coerce')
+        if not any(d in fmt for d in ['%Y', '%y', '%m', '%d', '%j']):
+            parsed = parsed - parsed.normalize()
+        return parsed.values
+    return convert_unique(vals, parse, keep_coerced)
+
+
+def episode_positions(ids, index):
+    """Row of infotb of each episode key in index
+
+    Args:
+        ids: key of each row of infotb (e.g. CCD.episode_ids())
+        index: episode keys of item data (e.g. the index from extract_one)
+    Returns:
+        np.ndarray: position in ids of each key of index
+    """
+    pos = (ids if isinstance(ids, pd.Index) else pd.Index(ids)).get_indexer(index)
+    # there's shouldn't be an index in the data that is not in infotb
+    # (-1 would otherwise index the last episode or match on time alone)
+    assert (pos >= 0).all()
+    return pos
+
+
+def sorted_join(left, right):
+    """Row of right with the same keys as each row of left (-1 if none)
+
+    Each key column is coded jointly for both sides and the codes combined
+    into one int64 key per row. right is sorted on it once and every row of
+    left looked up with a binary search, so all rows are joined at once.
+    Where keys are repeated in right the first row is taken. Missing keys
+    (NaN) never match.
+
+    Args:
+        left (list): key arrays of the left rows
+        right (list): key arrays (matching left) of the right rows
+    Returns:
+        np.ndarray: row of right for each row of left
+    """
+    nl, nr = len(left[0]), len(right[0])
+    kl, kr = np.zeros(nl, dtype='i8'), np.zeros(nr, dtype='i8')
+    valid_l = np.ones(nl, dtype=bool)
+    for l, r in zip(left, right):
+        codes, uniques = pd.factorize(np.r_[np.asarray(l), np.asarray(r)])
+        valid_l &= codes[:nl] >= 0
+        kl = kl * (len(uniques) + 1) + codes[:nl] + 1
+        kr = kr * (len(uniques) + 1) + codes[nl:] + 1
+    if not nr:
+        return np.full(nl, -1)
+    order = np.argsort(kr, kind='mergesort')
+    ks = kr[order]
+    i = np.minimum(np.searchsorted(ks, kl), nr - 1)
+    return np.where(valid_l & (ks[i] == kl), order[i], -1)
@@ -2,6 +2,8 @@ import sys
 import os
 import argparse
 import warnings
+from multiprocessing import Pool
+from multiprocessing.util import Finalize
 import numpy as np
 import seaborn as sns
 import matplotlib.pyplot as plt
@@ -15,17 +17,56 @@ pd.options.mode.chained_assignment = None  # default='warn'
 from inspectEHR.utils import load_spec
 from inspectEHR.CCD import CCD
 from inspectEHR.data_classes import DataRaw, ContMixin, CatMixin
+from inspectEHR.report import inspect_all, inspect_store, inspect_meta
 
 def to_decimal_hours(s):
     """Return series s as decimal hours"""
     return pd.to_timedelta(s).astype('timedelta64[s]')/3600
 
-def row_generator(NHICcode, ccd, spec, by=False, verbose=False):
+def row_generator(cc_item, by=False, verbose=False):
     """Mini function to use make row inspection more efficient"""
-    cc_item = DataRaw(NHICcode, ccd=ccd, spec=spec)
     if verbose:
-        print(NHICcode, cc_item.nrow)
-        return cc_item.inspect_row(by=by)
+        print(cc_item.NHICcode, cc_item.nrow)
+    return cc_item.inspect_row(by=by)
+
+# data opened once in each worker process by _init_worker
+_worker = {}
+
+def _init_worker(data_path, spec, memory=None):
+    """Open the (read only) data once in a worker process"""
+    warnings.simplefilter('ignore')
+    lazy = os.path.splitext(data_path)[1] == '.h5'
+    try:
+        # read each field from the store rather than hold a copy per worker
+        _worker['ccd'] = CCD(data_path, spec, lazy=lazy)
+    except ValueError:
+        if memory is not None:
+            raise
+        _worker['ccd'] = CCD(data_path, spec)
+    _worker['spec'] = spec
+    # close the store when the worker exits (after pool.close and join)
+    Finalize(_worker['ccd'], _worker['ccd'].close, exitpriority=0)
+
+def inspect_fields(fields, bysite=False, per_item=False, ccd=None, spec=None, memory=None, meta=False):
+    """Report rows for fields (against the worker's data if ccd is None)
+    With a memory budget (bytes) the fields are read from the store in chunks
+    With meta, rows for fields stratified by their meta item are added
+    Returns a list of dataframes to be concatenated together"""
+    if ccd is None:
+        ccd, spec = _worker['ccd'], _worker['spec']
+    if memory is not None:
+        rows = [inspect_store(ccd, spec, fields, by=bysite, memory=memory)]
+    elif per_item:
+        # extract all fields together (one scan of the data if JSON)
+        items = DataRaw.from_many(fields, ccd=ccd, spec=spec)
+        # parentheses turn the following into a generator expression
+        rows = list((row_generator(i, by=bysite, verbose=True) for i in items))
+    else:
+        # all fields summarised together from one pass over the long data
+        rows = [inspect_all(ccd, spec, fields, by=bysite)]
+    if meta:
+        rows.append(inspect_meta(ccd, spec, fields, by=bysite))
+    return rows
 
 def main(args, debug=False):
 
@@ -39,21 +80,41 @@ def main(args, debug=False):
     spec_path         = args.spec
     results_path      = args.to
     bysite            = args.bysite
+    # budget in bytes (shared between the workers)
+    memory            = args.memory * 2**20 / args.jobs if args.memory else None
 
     spec = load_spec(spec_path)
     spec_df = pd.DataFrame(spec).T
 
-    ccd = CCD(data_path, spec)
-
-    non_text_fields = ['numeric', 'list', 'list / logical', 'Logical']
+    non_text_fields = ['numeric', 'list', 'list / logical', 'Logical', 'date', 'time', 'date/time']
     fields2check = {k:v for k,v in spec.items() if v['Datatype'] in non_text_fields}
     fields = [k for k in fields2check.keys()][:field_limit]
 
-    # parentheses turn the following into a generator expression
-    rows = list((row_generator(f, ccd=ccd, spec=spec, by=bysite, verbose=True) for f in fields))
+    if args.jobs > 1:
+        # contiguous blocks of fields (several per worker to balance the load)
+        # mapped in order so the report is the same as with one process
+        n_blocks = min(len(fields), args.jobs * 4)
+        blocks = [list(b) for b in np.array_split(fields, n_blocks)]
+        print('*** Inspecting {} fields in {} blocks with {} workers'.format(len(fields), n_blocks, args.jobs))
+        with Pool(args.jobs, initializer=_init_worker, initargs=(data_path, spec, memory)) as pool:
+            rows = [r for block in pool.starmap(inspect_fields,
+                                                [(b, bysite, args.per_item, None, None, memory, args.meta)
+                                                 for b in blocks])
+                    for r in block]
+            # let the workers exit (and close their stores) before terminate
+            pool.close()
+            pool.join()
+    else:
+        # the store is read in chunks if there is a memory budget
+        with CCD(data_path, spec, lazy=memory is not None) as ccd:
+            rows = inspect_fields(fields, bysite, args.per_item, ccd=ccd, spec=spec, memory=memory, meta=args.meta)
 
     # Convert list of dataframes to single data frame
     results = pd.concat(rows)
+    if args.meta:
+        # meta rows after the other rows of their field
+        order = {k: i for i, k in enumerate(fields)}
+        results = results.iloc[np.argsort(results['NHICcode'].map(order).values, kind='mergesort')]
     # Merge in the rest of the data spec
     results = pd.merge(results, spec_df, on='NHICcode' )
 
@@ -61,9 +122,12 @@ def main(args, debug=False):
     for i in gaps:
         results[i] = to_decimal_hours(results[i])
 
-    col_order = "NHICcode site_id dataItem level count nunique n pct min 25% 50% 75% max mean std coerced_values miss_by_episode gap_period gap_start gap_stop".split()
+    col_order = "NHICcode site_id dataItem level count nunique n pct min 25% 50% 75% max mean std below within above future before_admission after_discharge coerced_values miss_by_episode gap_period gap_start gap_stop".split()
+    if args.meta:
+        col_order.insert(col_order.index('level') + 1, 'meta')
     # results[col_order].to_clipboard()
-    results[col_order].to_csv(results_path)
+    # (range columns are missing if no field inspected has a reference range)
+    results.reindex(columns=col_order).to_csv(results_path)
 
 def cli():
     ''' Command line interface for running script '''
@@ -88,6 +152,24 @@ def cli():
                         action='store_true',
                         help='Inspection stratified by site')
 
+    parser.add_argument('--per-item',
+                        action='store_true',
+                        help='Inspect each field with its own DataRaw (slower)')
+
+    parser.add_argument('-j', '--jobs',
+                        type=int,
+                        default=1,
+                        help='Number of worker processes')
+
+    parser.add_argument('-m', '--memory',
+                        type=int,
+                        default=None,
+                        help='Memory budget in MB; reads an h5 store (table format) in chunks')
+
+    parser.add_argument('--meta',
+                        action='store_true',
+                        help='Add rows for fields stratified by their meta item')
+
     args = parser.parse_args()
     return args
 
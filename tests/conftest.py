@@ -0,0 +1,12 @@
+import os
+import yaml
+import pytest
+
+SPEC_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'N_DataItems.yml')
+
+
+@pytest.fixture(scope='session')
+def spec():
+    """Data specification (read with safe_load, which newer PyYAML requires)"""
+    with open(SPEC_PATH, 'r') as f:
+        return yaml.safe_load(f)
@@ -0,0 +1,81 @@
+import json
+import pytest
+import numpy as np
+import pandas as pd
+import pandas.testing as pdt
+
+from inspectEHR.CCD import CCD
+from inspectEHR.synthetic import SyntheticCCD
+
+
+def _write(episodes, path):
+    with open(path, 'w') as f:
+        json.dump(episodes, f)
+    return str(path)
+
+
+def _read_store(path):
+    """infotb and items of an h5 store in a canonical order"""
+    res = {'infotb': pd.read_hdf(path, 'infotb').sort_values('eid').reset_index(drop=True)}
+    for k in ['item_1d', 'item_2d']:
+        df = pd.read_hdf(path, k)
+        df = df.astype({c: str for c in ['NHICcode', 'site_id']})
+        cols = ['eid', 'NHICcode'] + (['time'] if 'time' in df.columns else []) + [k.replace('_', '')]
+        res[k] = df.sort_values(cols).reset_index(drop=True)
+    return res
+
+
+def _changed(episodes, n, rng):
+    """Copy of episodes with n of them changed (an item dropped and a value edited)"""
+    episodes = json.loads(json.dumps(episodes))
+    for i in rng.choice(len(episodes), n, replace=False):
+        data = episodes[i]['data']
+        codes = [k for k in data if k not in ('pid', 'spell')]
+        del data[codes[0]]
+        for k in codes[1:]:
+            if isinstance(data[k], dict):
+                data[k]['item2d'][0] = 'changed'
+            else:
+                data[k] = 'changed'
+    return episodes
+
+
+def test_append_matches_rebuild(spec, tmp_path):
+    """Appending more than 31 changed episodes (a where query on that many
+    eids is a filter) and some new ones gives the store a rebuild would"""
+    rng = np.random.default_rng(1)
+    episodes = json.loads(json.dumps(list(SyntheticCCD(spec, n_episodes=60, items_per_episode=12))))
+    old, new = episodes[:50], _changed(episodes[:50], 40, rng) + episodes[50:]
+
+    base = str(tmp_path / 'base.h5')
+    CCD(_write(old, tmp_path / 'old.JSON'), spec).json2hdf(path=base, progress_marker=False, data_hash=True)
+    ccd = CCD(_write(new, tmp_path / 'new.JSON'), spec)
+    ccd.json2hdf(path=base, progress_marker=False, append=True)
+    full = str(tmp_path / 'full.h5')
+    ccd.json2hdf(path=full, progress_marker=False, data_hash=True)
+
+    appended, rebuilt = _read_store(base), _read_store(full)
+    assert len(appended['infotb']) == 60
+    for k in ['infotb', 'item_1d', 'item_2d']:
+        pdt.assert_frame_equal(appended[k], rebuilt[k], check_like=True)
+
+
+def test_append_that_does_not_fit_leaves_store(spec, tmp_path):
+    """A value wider than its column fails the append before the store is changed"""
+    episodes = json.loads(json.dumps(list(SyntheticCCD(spec, n_episodes=20, items_per_episode=12))))
+    base = str(tmp_path / 'base.h5')
+    CCD(_write(episodes, tmp_path / 'old.JSON'), spec).json2hdf(path=base, progress_marker=False, data_hash=True)
+    before = _read_store(base)
+
+    new = _changed(episodes, 5, np.random.default_rng(2))
+    code = next(k for k, v in new[-1]['data'].items() if k not in ('pid', 'spell') and not isinstance(v, dict))
+    new[-1]['data'][code] = 'x' * 1000
+    ccd = CCD(_write(new, tmp_path / 'new.JSON'), spec)
+    with pytest.raises(ValueError, match='does not fit'):
+        ccd.json2hdf(path=base, progress_marker=False, append=True)
+
+    after = _read_store(base)
+    for k in before:
+        pdt.assert_frame_equal(before[k], after[k])
+    with pd.HDFStore(base, mode='r') as store:
+        assert store.get_storer('item_1d').table.colindexed['eid']
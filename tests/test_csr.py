@@ -0,0 +1,36 @@
+import numpy as np
+import pandas as pd
+
+from inspectEHR.csr import CSRStore
+
+
+def _store(tmp_path):
+    infotb = pd.DataFrame({'eid': [0, 1, 2], 'site_id': ['A', 'B', 'A']})
+    item_1d = pd.DataFrame({'NHICcode': ['one_d'], 'item1d': ['x'], 'eid': [0]})
+    item_2d = pd.DataFrame({
+        'NHICcode': ['num'] * 4 + ['txt'] * 2,
+        'item2d': ['1.5', None, 'x', 2, 'a', 'a'],
+        'time': pd.to_timedelta([1, 2, 3, 4, 5, 6], unit='h'),
+        'eid': [0, 0, 2, 2, 1, 1]})
+    path = str(tmp_path / 'ccd.csr')
+    CSRStore.write(path, infotb, item_1d, item_2d, numeric=['num'])
+    return CSRStore(path)
+
+
+def test_to_frame_round_trip(tmp_path):
+    df = _store(tmp_path).to_frame('num')
+    assert list(df['item2d'].astype(object).where(df['item2d'].notnull(), None)) == ['1.5', None, 'x', '2']
+    assert list(df['eid']) == [0, 0, 2, 2]
+    assert list(df['site_id']) == ['A', 'A', 'A', 'A']
+    assert len(_store(tmp_path).to_frame('absent')) == 0
+
+
+def test_arrays_are_views(tmp_path):
+    csr = _store(tmp_path)
+    a = csr.item('num')
+    np.testing.assert_array_equal(a['values'], [1.5, np.nan, np.nan, 2.])
+    assert isinstance(a['values'], np.memmap)
+    assert 'values' not in csr.item('txt')
+    df = csr.to_frame('num')
+    assert np.shares_memory(df['time'].values, a['time'])
+    assert np.shares_memory(df['item2d'].values.codes, a['codes'])
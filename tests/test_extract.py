@@ -0,0 +1,21 @@
+import pandas as pd
+
+from inspectEHR.CCD import CCD
+
+
+def test_malformed_2d_item_skips_only_that_item():
+    ccd = pd.DataFrame({
+        'site_id': ['A', 'A'],
+        'episode_id': ['0', '1'],
+        'data': [
+            {'bad_2d': {'item2d': ['1', '2'], 'time': [0.5]},
+             'good_2d': {'item2d': ['3'], 'time': [1.0]},
+             'one_d': 'x'},
+            {'no_time': {'item2d': ['4']},
+             'one_d': 'y'}]})
+    item_1d, item_2d = CCD._extract_items(ccd, ['site_id', 'episode_id'], False)
+
+    assert item_1d[['NHICcode', 'item1d', 'episode_id']].values.tolist() == [
+        ['one_d', 'x', '0'], ['one_d', 'y', '1']]
+    assert item_2d[['NHICcode', 'item2d', 'episode_id']].values.tolist() == [['good_2d', '3', '0']]
+    assert item_2d['time'].tolist() == [pd.Timedelta(hours=1)]
@@ -0,0 +1,21 @@
+import pandas as pd
+
+from inspectEHR.CCD import CCD
+from inspectEHR.report import inspect_all
+from inspectEHR.synthetic import SyntheticCCD
+
+FIELDS = ['NIHR_HIC_ICU_0108', 'NIHR_HIC_ICU_0033', 'NIHR_HIC_ICU_0411', 'NIHR_HIC_ICU_0409']
+
+
+def test_inspect_all_reports_dates_in_order(spec, tmp_path):
+    sub = {k: spec[k] for k in FIELDS}
+    src = SyntheticCCD(sub, n_episodes=30, junk=0).to_json(str(tmp_path / 'ccd.JSON'))
+    res = inspect_all(CCD(src, sub), sub, FIELDS, by=True)
+
+    assert list(pd.unique(res['NHICcode'])) == FIELDS
+    dates = res[res['NHICcode'] == 'NIHR_HIC_ICU_0033']
+    assert sorted(dates['site_id']) == list('ABCDE')
+    assert dates['count'].sum() == 30
+    assert (dates['coerced_values'] == 0).all()
+    assert (dates[['future', 'before_admission', 'after_discharge']] == 0).all().all()
+    assert (dates['miss_by_episode'] == 0).all()
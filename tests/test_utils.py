@@ -0,0 +1,83 @@
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from inspectEHR.utils import sorted_join, segment_median, episode_positions
+from inspectEHR.utils import iter_json_array, segment_times
+from inspectEHR.utils import to_numeric_unique, parse_datetimes, VALID, BLANK, COERCED
+
+ELEMENTS = [{'a': [1, 2, 'x y'], 'b': {'c': None}}, 12345, 'str,]', [], {}, 3.5e-2, True]
+
+
+@pytest.mark.parametrize('blocksize', range(1, 12))
+def test_iter_json_array_across_blocks(tmp_path, blocksize):
+    path = tmp_path / 'a.json'
+    path.write_text('  \n' + json.dumps(ELEMENTS, indent=1) + '\n')
+    assert list(iter_json_array(str(path), blocksize)) == ELEMENTS
+
+
+@pytest.mark.parametrize('text', ['[{"a": 1}, {"a"', '[1, 23', '{"a": 1}'])
+def test_iter_json_array_malformed(tmp_path, text):
+    path = tmp_path / 'a.json'
+    path.write_text(text)
+    with pytest.raises(ValueError):
+        list(iter_json_array(str(path), 4))
+
+
+def test_sorted_join():
+    left = [np.array([0, 0, 1, 2, 2]), np.array([1., 2., 1., np.nan, 3.])]
+    right = [np.array([2, 0, 0, 1, 0]), np.array([3., 2., 1., 5., 2.])]
+    # repeated keys take the first row of right; NaN and absent keys give -1
+    np.testing.assert_array_equal(sorted_join(left, right), [2, 1, -1, -1, 0])
+
+
+def test_sorted_join_empty_right():
+    np.testing.assert_array_equal(sorted_join([np.array([1, 2])], [np.array([], dtype=int)]), [-1, -1])
+
+
+def test_segment_median():
+    values = np.array([3., 1., 2., 5., np.nan, 4., np.nan, 7.])
+    offsets = np.array([0, 3, 3, 6, 7, 8])
+    expected = [np.median([3., 1., 2.]), np.nan, np.median([5., 4.]), np.nan, 7.]
+    np.testing.assert_array_equal(segment_median(values, offsets), expected)
+
+
+def test_episode_positions():
+    np.testing.assert_array_equal(episode_positions([5, 3, 9], [9, 9, 5]), [2, 2, 0])
+    with pytest.raises(AssertionError):
+        episode_positions([5, 3, 9], [3, 4])
+
+
+def test_segment_times():
+    t = np.array([5., 1., 9., 4., np.nan, 2., 7., 3.])
+    g = np.array([0, 0, 2, 0, 2, 1, 2, 0])
+    tmin, tmax, gap = segment_times(t, g, 3)
+    np.testing.assert_array_equal(tmin, [1., 2., 7.])
+    np.testing.assert_array_equal(tmax, [5., 2., 9.])
+    # gaps within group 0 are 2, 1, 1; a single time has none; NaN is skipped
+    np.testing.assert_array_equal(gap, [1., np.nan, 2.])
+
+
+def test_to_numeric_unique():
+    vals = ['1.5', ' ', None, 'x', '1.5', 2, 'x']
+    converted, status, coerced = to_numeric_unique(vals, keep_coerced=True)
+    np.testing.assert_array_equal(converted, [1.5, np.nan, np.nan, np.nan, 1.5, 2., np.nan])
+    assert list(status) == [VALID, BLANK, BLANK, COERCED, VALID, VALID, COERCED]
+    assert isinstance(coerced, pd.Categorical)
+    assert list(coerced.categories) == ['x']
+    assert list(coerced.isna()) == [True, True, True, False, True, True, False]
+    # matches converting every value
+    expected = pd.to_numeric(pd.Series(vals, dtype=object), errors='coerce').values
+    np.testing.assert_array_equal(converted, expected)
+
+
+def test_parse_datetimes():
+    dates, status = parse_datetimes(['2020-01-02', 'bad', '', '2020-01-02', None], '%Y-%m-%d')
+    assert dates.dtype == 'datetime64[ns]'
+    assert list(pd.isnull(dates)) == [False, True, True, False, True]
+    assert list(status) == [VALID, COERCED, BLANK, VALID, BLANK]
+    times, status = parse_datetimes(['10:30', '25:00'], '%H:%M')
+    assert times[0] == np.timedelta64(10 * 60 + 30, 'm') and pd.isnull(times[1])
+    assert list(status) == [VALID, COERCED]